@@ -0,0 +1,95 @@
+""" Аутентификация по токену без запроса к базе на каждый запрос.
+
+Пользователь по токену хранится в памяти процесса. Чтобы выход, смена
+пароля или деактивация в одном процессе действовали и в остальных,
+у каждого пользователя есть версия auth:<id> в общем кэше: запись
+из памяти принимается, только пока версия не сброшена (см. signals.py).
+"""
+import copy
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .catalogue import bump_version, get_version
+from .response_cache import CacheStats
+
+
+def auth_version_name(user_id):
+    return f'auth:{user_id}'
+
+
+def invalidate_user_tokens(user_id):
+    """ Сбрасывает закэшированные токены пользователя во всех процессах.
+    """
+    bump_version(auth_version_name(user_id))
+
+
+class TokenCache:
+    """ LRU на size записей, каждая живёт не дольше ttl секунд. """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.lock = Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+token_cache = TokenCache(
+    settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL,
+)
+stats = CacheStats()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """ TokenAuthentication с кэшем токен -> пользователь. """
+
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is not None:
+            user, token, version = entry
+            if version == get_version(auth_version_name(user.pk)):
+                stats.add(True)
+                # Каждый запрос получает свою копию пользователя.
+                return copy.copy(user), token
+            token_cache.discard(key)
+        stats.add(False)
+        user_id = (
+            Token.objects.filter(key=key)
+            .values_list('user_id', flat=True).first()
+        )
+        if user_id is None:
+            # Неверный токен: ошибку вернёт TokenAuthentication.
+            return super().authenticate_credentials(key)
+        # Версия читается до пользователя: если сброс придётся между
+        # чтениями, запись с прежней версией не пройдёт проверку.
+        version = get_version(auth_version_name(user_id))
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (user, token, version))
+        return copy.copy(user), token
@@ -0,0 +1,118 @@
+import time
+from contextlib import nullcontext
+from hashlib import md5
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+
+from .db_router import primary_reads
+from .renderers import FastJSONRenderer
+
+CATALOGUE_TIMEOUT = 60 * 60
+CACHE_CONTROL = {'public': True, 'max_age': 60}
+
+
+def new_version(changed_at):
+    """ Случайный токен с моментом изменения: по нему видно, как давно
+    сброшена версия (см. primary_if_changed).
+    """
+    return f'{changed_at:.3f}:{uuid4().hex}'
+
+
+def version_changed_at(version):
+    """ Момент изменения из токена версии, 0 для токенов без него. """
+    try:
+        return float(str(version).partition(':')[0])
+    except ValueError:
+        return 0
+
+
+def primary_if_changed(versions):
+    """ Данные для кэша после недавнего изменения читаются из основной
+    базы, иначе отставшая реплика попадёт в кэш под новой версией.
+    """
+    horizon = time.time() - settings.REPLICA_STICKY_SECONDS
+    if all(version_changed_at(version) < horizon for version in versions):
+        return nullcontext()
+    return primary_reads()
+
+
+def get_versions(*names):
+    """ Текущие версии справочников одним запросом к кэшу.
+
+    Версия - случайный токен, а не счётчик: если ключ вытеснен из кэша,
+    новый токен не совпадёт ни с одним закэшированным ответом.
+    """
+    keys = {name: f'catalogue:{name}:version' for name in names}
+    versions = cache.get_many(keys.values())
+    missing = [name for name in names if keys[name] not in versions]
+    if missing:
+        # Ключа ещё нет или он вытеснен: когда менялись данные, неизвестно.
+        for name in missing:
+            cache.add(keys[name], new_version(0), None)
+        versions.update(cache.get_many([keys[name] for name in missing]))
+    return [versions.get(keys[name]) for name in names]
+
+
+def get_version(name):
+    """ Текущая версия справочника. """
+    return get_versions(name)[0]
+
+
+def bump_version(*names):
+    """ Сбрасывает версии после фиксации транзакции.
+
+    Иначе параллельный запрос успеет закэшировать ещё старые данные
+    под новой версией.
+    """
+    transaction.on_commit(lambda: cache.set_many(
+        {
+            f'catalogue:{name}:version': new_version(time.time())
+            for name in names
+        },
+        None,
+    ))
+
+
+def get_cached(name, version, key, get_data):
+    cache_key = f'catalogue:{name}:{version}:{key}'
+    data = cache.get(cache_key)
+    if data is None:
+        with primary_if_changed([version]):
+            data = get_data()
+        cache.set(cache_key, data, CATALOGUE_TIMEOUT)
+    return data
+
+
+def get_catalogue_data(name, key, get_data):
+    """ Данные, построенные по справочнику и сброшенные при его изменении.
+    """
+    return get_cached(name, get_version(name), key, get_data)
+
+
+def catalogue_response(request, name, get_data, variant=''):
+    """ Готовый JSON справочника с ETag и ответом 304 на If-None-Match.
+
+    get_data вызывается, только если ответа для текущей версии
+    справочника ещё нет в кэше.
+    """
+    version = get_version(name)
+    etag = quote_etag(md5(f'{version}:{variant}'.encode()).hexdigest())
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        content = get_cached(
+            name,
+            version,
+            f'response:{md5(variant.encode()).hexdigest()}',
+            lambda: FastJSONRenderer().render(get_data()),
+        )
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, **CACHE_CONTROL)
+    return response
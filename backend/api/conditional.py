@@ -0,0 +1,43 @@
+""" Условные запросы: ETag, Last-Modified и ответ 304.
+
+Версия ответа берётся одним дешёвым запросом (updated_at рецепта,
+cart_updated_at пользователя). Если у клиента та же версия, ответ
+не собирается и не сериализуется.
+"""
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+def make_etag(request, *parts):
+    """ ETag из версии данных и того, от чего ещё зависит ответ.
+
+    Формат выбирается по Accept, а ссылки на изображения - абсолютные.
+    """
+    return quote_etag(md5(':'.join(map(str, [
+        request.scheme,
+        request.get_host(),
+        request.accepted_media_type,
+        *parts,
+    ])).encode()).hexdigest())
+
+
+def conditional_response(request, get_response, etag, last_modified=None):
+    """ 304, если у клиента та же версия, иначе ответ get_response.
+
+    Без last_modified проверяется только ETag.
+    """
+    timestamp = (
+        int(last_modified.timestamp()) if last_modified is not None else None
+    )
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp,
+    )
+    if response is None:
+        response = get_response()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+    return response
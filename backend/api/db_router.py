@@ -0,0 +1,93 @@
+""" Чтение из реплик базы.
+
+Реплики задаются в DB_REPLICA_HOSTS. Безопасные запросы к API читают
+из случайной реплики, запись и всё остальное - основная база.
+Клиент, который только что что-то записал, ещё REPLICA_STICKY_SECONDS
+читает из основной базы, чтобы сразу увидеть свои изменения: отставание
+реплики должно укладываться в это окно.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY = 'default'
+API_PREFIX = '/api/'
+# Токен и сессия создаются прямо перед первым запросом с ними, и реплика
+# может их ещё не получить.
+PRIMARY_MODELS = {'authtoken.token', 'sessions.session'}
+
+use_replicas = ContextVar('use_replicas', default=False)
+
+
+def get_replicas():
+    return [alias for alias in settings.DATABASES if alias != PRIMARY]
+
+
+def sticky_key(request):
+    """ Ключ закрепления за основной базой: токен или сессия клиента. """
+    credentials = request.META.get('HTTP_AUTHORIZATION') or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    return f'replica:sticky:{md5(credentials.encode()).hexdigest()}'
+
+
+def reads_from_replicas(request):
+    """ Можно ли этому запросу читать из реплик. """
+    if (
+        request.method not in SAFE_METHODS
+        or not request.path.startswith(API_PREFIX)
+    ):
+        return False
+    key = sticky_key(request)
+    return key is None or not cache.get(key)
+
+
+def stick_to_primary(request):
+    """ Следующие запросы клиента читают из основной базы. """
+    key = sticky_key(request)
+    if key is not None:
+        cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+
+
+@contextmanager
+def primary_reads():
+    """ Внутри блока всё читается из основной базы. """
+    token = use_replicas.set(False)
+    try:
+        yield
+    finally:
+        use_replicas.reset(token)
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self.replicas = get_replicas()
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if (
+            self.replicas
+            and use_replicas.get()
+            and model._meta.label_lower not in PRIMARY_MODELS
+        ):
+            return random.choice(self.replicas)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == PRIMARY
@@ -1,17 +1,53 @@
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
+from django_filters.widgets import QueryArrayWidget
 
-from recipes.models import Recipes
+from recipes.models import Recipes, Tags
+from .catalogue import get_catalogue_data
 
 
-class IngredientFilter(SearchFilter):
-    search_param = 'name'
+def get_tag_ids():
+    """ Словарь {slug: id} тегов из кэша справочника. """
+    return get_catalogue_data(
+        'tags',
+        'slugs',
+        lambda: dict(Tags.objects.values_list('slug', 'id')),
+    )
+
+
+class SlugListField(forms.Field):
+    widget = QueryArrayWidget
+
+    def to_python(self, value):
+        return [slug for slug in value or () if slug]
+
+
+class TagsFilter(filters.Filter):
+    """ Рецепты хотя бы с одним из тегов.
+
+    Слаги переводятся в id по кэшу тегов, а фильтр строится как EXISTS
+    по таблице связей: без JOIN, дублей строк и DISTINCT.
+    """
+    field_class = SlugListField
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        tag_ids = get_tag_ids()
+        tag_ids = [tag_ids[slug] for slug in value if slug in tag_ids]
+        if not tag_ids:
+            return qs.none()
+        return qs.filter(Exists(
+            Recipes.tags.through.objects.filter(
+                recipes_id=OuterRef('pk'),
+                tags_id__in=tag_ids,
+            )
+        ))
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug',
-    )
+    tags = TagsFilter()
 
     class Meta:
         model = Recipes
@@ -0,0 +1,104 @@
+""" ASGI-обработчик, в котором медленный запрос не задерживает остальные.
+
+Django 3.2 под ASGI выполняет все синхронные представления и хуки
+middleware в одном общем потоке процесса, а потоковые ответы читает
+прямо в цикле событий, где запросы к базе запрещены. Поэтому здесь:
+
+- middleware и представление целиком выполняются в пуле из ASGI_THREADS
+  потоков, по одному переходу между потоками на запрос, и каждый поток
+  держит своё соединение с базой;
+- потоковый ответ, например выгрузка списка покупок, читается в своём
+  потоке, пока клиент его скачивает.
+
+Цикл событий при этом принимает соединения, читает тела запросов
+и отдаёт ответы медленным клиентам, не занимая потоки пула.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+
+
+def read_chunk(parts, size):
+    """ Собирает фрагменты до size байт: меньше переходов между потоками.
+    """
+    chunk = []
+    length = 0
+    for part in parts:
+        chunk.append(part)
+        length += len(part)
+        if length >= size:
+            break
+    return b''.join(chunk) if chunk else None
+
+
+class ThreadPoolASGIHandler(ASGIHandler):
+    def __init__(self):
+        super().__init__()
+        self.get_response_in_thread = sync_to_async(
+            self.get_response_closing,
+            thread_sensitive=False,
+            executor=ThreadPoolExecutor(
+                max_workers=settings.ASGI_THREADS,
+                thread_name_prefix='request',
+            ),
+        )
+
+    def load_middleware(self, is_async=False):
+        # Синхронная цепочка целиком выполняется в потоке пула.
+        super().load_middleware(is_async=False)
+
+    def get_response_closing(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            # Сигналы request_started и request_finished закрывают
+            # соединения общего потока, а не этого.
+            close_old_connections()
+
+    async def get_response_async(self, request):
+        return await self.get_response_in_thread(request)
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [
+            (header.encode('ascii'), value.encode('latin1'))
+            for header, value in response.items()
+        ]
+        headers.extend(
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        )
+        # Итератор, его серверный курсор и соединение с базой должны
+        # оставаться в одном потоке.
+        with ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='stream',
+        ) as executor:
+            def in_stream_thread(func):
+                return sync_to_async(
+                    func, thread_sensitive=False, executor=executor,
+                )
+
+            parts = iter(response)
+            read = in_stream_thread(read_chunk)
+            try:
+                await send({
+                    'type': 'http.response.start',
+                    'status': response.status_code,
+                    'headers': headers,
+                })
+                while (
+                    chunk := await read(parts, self.chunk_size)
+                ) is not None:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+                await send({'type': 'http.response.body'})
+            finally:
+                # Сигнал request_finished закроет соединение этого потока.
+                await in_stream_thread(response.close)()
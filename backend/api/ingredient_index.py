@@ -0,0 +1,65 @@
+import threading
+import time
+from bisect import bisect_left
+
+from recipes.models import Ingredients
+from .catalogue import get_version, primary_if_changed
+
+SEARCH_LIMIT = 50
+# Изменения в других процессах подхватываются не позже, чем через TTL.
+INDEX_TTL = 300
+
+
+class IngredientIndex:
+    """ Отсортированный индекс ингредиентов для поиска по началу названия.
+
+    Загружается из базы при первом обращении и живёт в памяти процесса.
+    Индекс перестраивается, когда меняется версия справочника
+    ингредиентов, и не реже, чем раз в INDEX_TTL секунд.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._loaded_at = 0
+
+    def _get_index(self):
+        index = self._index
+        version = get_version('ingredients')
+        expired = (
+            version != self._version
+            or time.monotonic() - self._loaded_at >= INDEX_TTL
+        )
+        if index is not None and not expired:
+            return index
+        with self._lock:
+            if self._index is not index:
+                return self._index
+            with primary_if_changed([version]):
+                rows = sorted(
+                    Ingredients.objects.values(
+                        'id', 'name', 'measurement_unit',
+                    ),
+                    key=lambda row: (row['name'].casefold(), row['id']),
+                )
+            self._index = ([row['name'].casefold() for row in rows], rows)
+            self._version = version
+            self._loaded_at = time.monotonic()
+            return self._index
+
+    def search(self, prefix='', limit=SEARCH_LIMIT):
+        """ Ингредиенты, название которых начинается с prefix.
+
+        Поиск без учёта регистра; точное совпадение идёт первым,
+        остальные - по алфавиту. Без prefix возвращается весь список.
+        """
+        keys, rows = self._get_index()
+        if not prefix:
+            return rows
+        prefix = prefix.casefold()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + chr(0x10FFFF), start)
+        return rows[start:min(end, start + limit)]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,399 @@
+""" Нагрузочный тест API.
+
+Прогон идёт на тестовой базе (test_<имя базы>, для SQLite - в памяти),
+которая заполняется детерминированными данными и удаляется после
+прогона. Запросы выполняет тестовый клиент Django в этом же процессе,
+поэтому сеть и gunicorn в замер не входят.
+
+    python manage.py bench_api --output before.json
+    python manage.py bench_api --output after.json --compare before.json
+
+Для SQLite достаточно POSTGRES_ENGINE=django.db.backends.sqlite3.
+"""
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import setup_databases, teardown_databases
+from rest_framework.authtoken.models import Token
+
+from api.middleware import QueryTimer
+from recipes.models import Ingredients, Recipes, Tags, User
+
+REQUESTS = 2000
+WARMUP = 200
+USERS = 100
+RECIPES = 1000
+SEED = 42
+PAGE_SIZE = 6
+# Доли сценариев примерно как у фронтенда: лента открывается чаще всего,
+# выгрузка списка покупок - реже всего.
+SCENARIOS = {
+    'feed': 30,
+    'feed_favorited': 4,
+    'recipe': 20,
+    'ingredients': 10,
+    'favorite_toggle': 8,
+    'shopping_cart_toggle': 8,
+    'subscriptions': 6,
+    'subscribe_toggle': 2,
+    'me': 10,
+    'download_shopping_cart': 2,
+}
+
+
+def percentile(values, share):
+    """ Перцентиль по ближайшему рангу. """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+class Dataset:
+    """ Детерминированные тестовые данные для нагрузки. """
+
+    def __init__(self, seed, users, recipes):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.users_count = users
+        self.recipes_count = recipes
+
+    def create(self):
+        call_command(
+            'generate_data',
+            users=self.users_count,
+            recipes=self.recipes_count,
+            seed=self.seed,
+        )
+        Token.objects.bulk_create(
+            Token(key=f'{self.rng.getrandbits(160):040x}', user_id=user_id)
+            for user_id in User.objects.order_by('id').values_list(
+                'id', flat=True,
+            )
+        )
+
+    def load(self):
+        """ Идентификаторы, из которых выбирают сценарии. """
+        self.ingredient_names = list(
+            Ingredients.objects.order_by('id').values_list('name', flat=True)
+        )
+        self.tag_slugs = list(
+            Tags.objects.order_by('id').values_list('slug', flat=True)
+        )
+        self.tokens = dict(Token.objects.values_list('user_id', 'key'))
+        self.user_ids = sorted(self.tokens)
+        self.recipe_ids = list(
+            Recipes.objects.order_by('id').values_list('id', flat=True)
+        )
+
+
+class Worker:
+    """ Клиент, который выполняет сценарии и собирает замеры. """
+
+    def __init__(self, dataset, seed):
+        self.dataset = dataset
+        self.rng = random.Random(seed)
+        # Ошибки сервера считаются как ответы 500, а не роняют поток.
+        self.client = Client(raise_request_exception=False)
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def request(self, label, method, url, user_id=None, expected=(200,)):
+        headers = {}
+        if user_id is not None:
+            headers['HTTP_AUTHORIZATION'] = (
+                f'Token {self.dataset.tokens[user_id]}'
+            )
+        timer = QueryTimer()
+        with ExitStack() as stack:
+            for db in connections.all():
+                stack.enter_context(db.execute_wrapper(timer))
+            started = time.perf_counter()
+            response = self.client.generic(method, url, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            duration = time.perf_counter() - started
+        self.samples[label].append((duration, timer.count))
+        if response.status_code not in expected:
+            self.errors[label] += 1
+
+    def user(self):
+        return self.rng.choice(self.dataset.user_ids)
+
+    def recipe(self):
+        return self.rng.choice(self.dataset.recipe_ids)
+
+    def feed(self):
+        user_id = self.user() if self.rng.random() < 0.5 else None
+        tags = self.rng.sample(
+            self.dataset.tag_slugs,
+            self.rng.randint(0, len(self.dataset.tag_slugs)),
+        )
+        url = (
+            f'/api/recipes/?page={self.rng.randint(1, 5)}'
+            f'&limit={PAGE_SIZE}'
+            + ''.join(f'&tags={slug}' for slug in tags)
+        )
+        self.request('tags', 'GET', '/api/tags/', user_id)
+        self.request('feed', 'GET', url, user_id)
+
+    def feed_favorited(self):
+        self.request(
+            'feed_favorited',
+            'GET',
+            f'/api/recipes/?page=1&limit={PAGE_SIZE}&is_favorited=1',
+            self.user(),
+        )
+
+    def recipe_detail(self):
+        user_id = self.user() if self.rng.random() < 0.5 else None
+        self.request(
+            'recipe', 'GET', f'/api/recipes/{self.recipe()}/', user_id,
+        )
+
+    def ingredients(self):
+        name = self.rng.choice(self.dataset.ingredient_names)
+        for length in range(1, min(len(name), 3) + 1):
+            self.request(
+                'ingredients',
+                'GET',
+                f'/api/ingredients/?{urlencode({"name": name[:length]})}',
+            )
+
+    def toggle(self, label, url, user_id):
+        self.request(label, 'POST', url, user_id, expected=(201, 400))
+        self.request(label, 'DELETE', url, user_id, expected=(204, 400))
+
+    def favorite_toggle(self):
+        self.toggle(
+            'favorite_toggle',
+            f'/api/recipes/{self.recipe()}/favorite/',
+            self.user(),
+        )
+
+    def shopping_cart_toggle(self):
+        self.toggle(
+            'shopping_cart_toggle',
+            f'/api/recipes/{self.recipe()}/shopping_cart/',
+            self.user(),
+        )
+
+    def subscribe_toggle(self):
+        self.toggle(
+            'subscribe_toggle',
+            f'/api/users/{self.user()}/subscribe/',
+            self.user(),
+        )
+
+    def subscriptions(self):
+        self.request(
+            'subscriptions',
+            'GET',
+            f'/api/users/subscriptions/?page=1&limit={PAGE_SIZE}'
+            '&recipes_limit=3',
+            self.user(),
+        )
+
+    def me(self):
+        self.request('me', 'GET', '/api/users/me/', self.user())
+
+    def download_shopping_cart(self):
+        self.request(
+            'download_shopping_cart',
+            'GET',
+            '/api/recipes/download_shopping_cart/',
+            self.user(),
+        )
+
+    def run(self, count):
+        names = list(SCENARIOS)
+        weights = list(SCENARIOS.values())
+        try:
+            for name in self.rng.choices(names, weights, k=count):
+                getattr(self, 'recipe_detail' if name == 'recipe' else name)()
+        finally:
+            connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест API на отдельной тестовой базе: смесь запросов '
+        'фронтенда, перцентили времени ответа, пропускная способность '
+        'и запросы к базе. Результаты сохраняются в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', default=REQUESTS, type=int,
+            help='Количество сценариев на каждый поток.',
+        )
+        parser.add_argument(
+            '--warmup', default=WARMUP, type=int,
+            help='Сценарии для прогрева, в результаты не попадают.',
+        )
+        parser.add_argument(
+            '--concurrency', default=1, type=int,
+            help=(
+                'Количество параллельных потоков. На SQLite одновременные '
+                'записи могут упираться в блокировку базы.'
+            ),
+        )
+        parser.add_argument('--users', default=USERS, type=int)
+        parser.add_argument('--recipes', default=RECIPES, type=int)
+        parser.add_argument(
+            '--seed', default=SEED, type=int,
+            help='Зерно генератора данных и сценариев.',
+        )
+        parser.add_argument(
+            '--output', type=Path,
+            help='Файл для результатов в JSON.',
+        )
+        parser.add_argument(
+            '--compare', type=Path,
+            help='JSON предыдущего прогона для сравнения.',
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help=(
+                'Не удалять тестовую базу и использовать её данные '
+                'в следующем прогоне.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        previous = None
+        if options['compare']:
+            previous = json.loads(options['compare'].read_text())
+        # Тестовая база и отдельный префикс кэша, чтобы прогон не задел
+        # рабочие данные, даже если кэш общий.
+        cache_settings = {
+            alias: {**config, 'KEY_PREFIX': f'bench-{uuid4().hex}'}
+            for alias, config in settings.CACHES.items()
+        }
+        with override_settings(
+            DEBUG=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            CACHES=cache_settings,
+            IMAGE_RENDITION_WORKERS=0,
+        ):
+            old_config = setup_databases(
+                verbosity=0, interactive=False, keepdb=options['keepdb'],
+            )
+            try:
+                results = self.benchmark(options)
+            finally:
+                teardown_databases(
+                    old_config, verbosity=0, keepdb=options['keepdb'],
+                )
+        self.report(results, previous)
+        if options['output']:
+            options['output'].write_text(
+                json.dumps(results, ensure_ascii=False, indent=2)
+            )
+            print(f'Результаты сохранены в {options["output"]}.')
+
+    def benchmark(self, options):
+        dataset = Dataset(
+            options['seed'], options['users'], options['recipes'],
+        )
+        # С --keepdb данные прошлого прогона используются повторно.
+        if not Recipes.objects.exists():
+            dataset.create()
+        dataset.load()
+        if not dataset.tokens:
+            raise CommandError('В тестовой базе нет пользователей с токенами.')
+        Worker(dataset, options['seed']).run(options['warmup'])
+        workers = [
+            Worker(dataset, options['seed'] + number + 1)
+            for number in range(options['concurrency'])
+        ]
+        threads = [
+            threading.Thread(target=worker.run, args=(options['requests'],))
+            for worker in workers
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        samples = defaultdict(list)
+        errors = defaultdict(int)
+        for worker in workers:
+            for label, values in worker.samples.items():
+                samples[label].extend(values)
+            for label, count in worker.errors.items():
+                errors[label] += count
+        samples['total'] = [
+            value for label in list(samples) for value in samples[label]
+        ]
+        errors['total'] = sum(errors.values())
+        return {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'options': {
+                key: options[key] for key in (
+                    'requests', 'warmup', 'concurrency', 'users', 'recipes',
+                    'seed',
+                )
+            },
+            'elapsed': round(elapsed, 3),
+            'endpoints': {
+                label: self.summary(values, errors[label], elapsed)
+                for label, values in samples.items()
+            },
+        }
+
+    @staticmethod
+    def summary(values, errors, elapsed):
+        durations = [duration * 1000 for duration, _ in values]
+        queries = [count for _, count in values]
+        return {
+            'requests': len(values),
+            'errors': errors,
+            'throughput': round(len(values) / elapsed, 2),
+            'p50_ms': round(percentile(durations, 0.5), 3),
+            'p95_ms': round(percentile(durations, 0.95), 3),
+            'p99_ms': round(percentile(durations, 0.99), 3),
+            'queries_mean': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+        }
+
+    @staticmethod
+    def report(results, previous=None):
+        print(
+            f'База: {results["database"]}, время: {results["elapsed"]} с.'
+        )
+        print(
+            f'{"endpoint":24}{"запросов":>10}{"ошибок":>8}{"RPS":>10}'
+            f'{"p50, мс":>10}{"p95, мс":>10}{"p99, мс":>10}{"SQL":>8}'
+        )
+        for label, row in sorted(results['endpoints'].items()):
+            line = (
+                f'{label:24}{row["requests"]:>10}{row["errors"]:>8}'
+                f'{row["throughput"]:>10}{row["p50_ms"]:>10}'
+                f'{row["p95_ms"]:>10}{row["p99_ms"]:>10}'
+                f'{row["queries_mean"]:>8}'
+            )
+            old = (previous or {}).get('endpoints', {}).get(label)
+            if old:
+                line += (
+                    f'  p95 {(row["p95_ms"] / old["p95_ms"] - 1) * 100:+.1f}%'
+                    f', SQL {row["queries_mean"] - old["queries_mean"]:+.2f}'
+                )
+            print(line)
@@ -0,0 +1,371 @@
+""" Сравнение WSGI- и ASGI-развёртывания под параллельной нагрузкой.
+
+Команда по очереди запускает gunicorn с синхронными воркерами
+(foodgram.wsgi) и с воркерами uvicorn (foodgram.asgi) на текущей базе
+и нагружает оба по HTTP одинаковой смесью запросов на чтение. Часть
+клиентов в это время медленно скачивает список покупок. В отличие от
+bench_api, замер включает сеть, воркеры и очереди gunicorn.
+
+    python manage.py generate_data --users 1000 --recipes 5000
+    python manage.py bench_deployments --workers 2 --concurrency 32
+
+Команда создаёт токен для одного пользователя со списком покупок,
+остальные данные не меняет.
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (
+    Ingredients,
+    Recipes,
+    ShoppingListIngredients,
+    Tags,
+)
+from .bench_api import PAGE_SIZE, SEED, percentile
+
+REQUESTS = 200
+CONCURRENCY = 32
+WORKERS = 2
+PORT = 8765
+STARTUP_TIMEOUT = 30
+SLOW_CHUNK = 1024
+DEPLOYMENTS = {
+    'wsgi': ['foodgram.wsgi'],
+    'asgi': [
+        'foodgram.asgi:application',
+        '--worker-class', 'uvicorn.workers.UvicornWorker',
+    ],
+}
+SCENARIOS = {
+    'feed': 40,
+    'recipe': 30,
+    'ingredients': 15,
+    'tags': 10,
+    'download_shopping_cart': 5,
+}
+
+
+class Client:
+    """ Клиент, который выполняет запросы на чтение и собирает замеры. """
+
+    def __init__(self, base_url, targets, seed):
+        self.base_url = base_url
+        self.targets = targets
+        self.rng = random.Random(seed)
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def get(self, path, params=None, token=None, delay=0):
+        url = f'{self.base_url}{path}'
+        if params:
+            url += f'?{urlencode(params, doseq=True)}'
+        request = Request(url)
+        if token:
+            request.add_header('Authorization', f'Token {token}')
+        with urlopen(request, timeout=60) as response:
+            if not delay:
+                return response.read()
+            while response.read(SLOW_CHUNK):
+                time.sleep(delay)
+
+    def request(self, label, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            self.get(*args, **kwargs)
+        except (HTTPError, URLError, OSError):
+            self.errors[label] += 1
+        self.samples[label].append(time.perf_counter() - started)
+
+    def feed(self):
+        tag = None
+        if self.rng.random() < 0.3:
+            tag = self.rng.choice(list(self.targets['pages']))
+        params = {
+            'page': self.rng.randint(1, self.targets['pages'][tag]),
+            'limit': PAGE_SIZE,
+        }
+        if tag:
+            params['tags'] = tag
+        self.request('feed', '/api/recipes/', params)
+
+    def recipe(self):
+        recipe_id = self.rng.choice(self.targets['recipe_ids'])
+        self.request('recipe', f'/api/recipes/{recipe_id}/')
+
+    def ingredients(self):
+        name = self.rng.choice(self.targets['ingredient_names'])
+        self.request(
+            'ingredients', '/api/ingredients/', {'name': name[:3].lower()},
+        )
+
+    def tags(self):
+        self.request('tags', '/api/tags/')
+
+    def download_shopping_cart(self, delay=0):
+        self.request(
+            'slow_download' if delay else 'download_shopping_cart',
+            '/api/recipes/download_shopping_cart/',
+            token=self.targets['token'],
+            delay=delay,
+        )
+
+    def run(self, count):
+        names = list(SCENARIOS)
+        weights = list(SCENARIOS.values())
+        for name in self.rng.choices(names, weights, k=count):
+            getattr(self, name)()
+
+    def run_slow(self, delay, stop):
+        while not stop.is_set():
+            self.download_shopping_cart(delay)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает синхронный gunicorn (WSGI) и gunicorn с воркерами '
+        'uvicorn (ASGI) под параллельной нагрузкой на чтение.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--deployments', nargs='+', default=list(DEPLOYMENTS),
+            choices=list(DEPLOYMENTS),
+        )
+        parser.add_argument(
+            '--requests', default=REQUESTS, type=int,
+            help='Количество запросов на каждого клиента.',
+        )
+        parser.add_argument(
+            '--concurrency', default=CONCURRENCY, type=int,
+            help='Количество одновременных клиентов.',
+        )
+        parser.add_argument(
+            '--slow-clients', default=2, type=int,
+            help='Клиенты, которые всё время медленно скачивают список.',
+        )
+        parser.add_argument(
+            '--slow-delay', default=0.05, type=float,
+            help=f'Пауза медленного клиента после каждых {SLOW_CHUNK} байт.',
+        )
+        parser.add_argument(
+            '--workers', default=WORKERS, type=int,
+            help='Процессы gunicorn в обоих режимах.',
+        )
+        parser.add_argument(
+            '--threads', default=settings.ASGI_THREADS, type=int,
+            help='ASGI_THREADS для ASGI-воркеров.',
+        )
+        parser.add_argument('--port', default=PORT, type=int)
+        parser.add_argument('--seed', default=SEED, type=int)
+        parser.add_argument(
+            '--output', type=Path,
+            help='Файл для результатов в JSON.',
+        )
+
+    def handle(self, *args, **options):
+        targets = self.targets()
+        results = {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'options': {
+                key: options[key] for key in (
+                    'requests', 'concurrency', 'slow_clients', 'slow_delay',
+                    'workers', 'threads', 'seed',
+                )
+            },
+            'deployments': {},
+        }
+        for name in options['deployments']:
+            print(f'Запуск {name}...')
+            with self.server(name, options):
+                results['deployments'][name] = self.benchmark(
+                    targets, options,
+                )
+        self.report(results)
+        if options['output']:
+            options['output'].write_text(
+                json.dumps(results, ensure_ascii=False, indent=2)
+            )
+            print(f'Результаты сохранены в {options["output"]}.')
+
+    @staticmethod
+    def targets():
+        """ Данные, из которых выбирают запросы. """
+        recipe_ids = list(Recipes.objects.values_list('id', flat=True))
+        if not recipe_ids:
+            raise CommandError(
+                'В базе нет рецептов: создайте их командой generate_data.'
+            )
+        buyer = (
+            ShoppingListIngredients.objects.values('user')
+            .annotate(rows=Count('id')).order_by('-rows', 'user').first()
+        )
+        if buyer is None:
+            raise CommandError('В базе нет ни одного списка покупок.')
+        token, _ = Token.objects.get_or_create(user_id=buyer['user'])
+        # Страниц в ленте без фильтра (ключ None) и с фильтром по тегу.
+        pages = {
+            slug: count // PAGE_SIZE
+            for slug, count in Tags.objects.annotate(
+                count=Count('recipes'),
+            ).values_list('slug', 'count')
+            if count >= PAGE_SIZE
+        }
+        pages[None] = max(len(recipe_ids) // PAGE_SIZE, 1)
+        return {
+            'recipe_ids': sorted(recipe_ids),
+            'pages': pages,
+            'ingredient_names': list(
+                Ingredients.objects.order_by('id')
+                .values_list('name', flat=True)[:500]
+            ),
+            'token': token.key,
+        }
+
+    def server(self, name, options):
+        """ Контекстный менеджер с запущенным gunicorn. """
+        command = [
+            sys.executable, '-m', 'gunicorn', *DEPLOYMENTS[name],
+            '--bind', f'127.0.0.1:{options["port"]}',
+            '--workers', str(options['workers']),
+            '--log-level', 'warning',
+        ]
+        env = {**os.environ, 'ASGI_THREADS': str(options['threads'])}
+        return Server(command, env, settings.BASE_DIR, options['port'])
+
+    def benchmark(self, targets, options):
+        base_url = f'http://127.0.0.1:{options["port"]}'
+        seed = options['seed']
+        # Прогрев: первые запросы воркеров заполняют кэши.
+        Client(base_url, targets, seed).run(options['workers'] * 20)
+        clients = [
+            Client(base_url, targets, seed + number + 1)
+            for number in range(options['concurrency'])
+        ]
+        slow_clients = [
+            Client(base_url, targets, seed)
+            for _ in range(options['slow_clients'])
+        ]
+        stop = threading.Event()
+        slow_threads = [
+            threading.Thread(
+                target=client.run_slow, args=(options['slow_delay'], stop),
+            )
+            for client in slow_clients
+        ]
+        threads = [
+            threading.Thread(target=client.run, args=(options['requests'],))
+            for client in clients
+        ]
+        for thread in slow_threads:
+            thread.start()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in slow_threads:
+            thread.join()
+
+        samples = defaultdict(list)
+        errors = defaultdict(int)
+        for client in clients + slow_clients:
+            for label, values in client.samples.items():
+                samples[label].extend(values)
+            for label, count in client.errors.items():
+                errors[label] += count
+        samples['total'] = [
+            value
+            for label, values in samples.items()
+            if label != 'slow_download'
+            for value in values
+        ]
+        errors['total'] = sum(
+            count for label, count in errors.items()
+            if label != 'slow_download'
+        )
+        return {
+            'elapsed': round(elapsed, 3),
+            'endpoints': {
+                label: self.summary(values, errors[label], elapsed)
+                for label, values in samples.items()
+            },
+        }
+
+    @staticmethod
+    def summary(values, errors, elapsed):
+        durations = [duration * 1000 for duration in values]
+        return {
+            'requests': len(values),
+            'errors': errors,
+            'throughput': round(len(values) / elapsed, 2),
+            'p50_ms': round(percentile(durations, 0.5), 3),
+            'p95_ms': round(percentile(durations, 0.95), 3),
+            'p99_ms': round(percentile(durations, 0.99), 3),
+        }
+
+    @staticmethod
+    def report(results):
+        print(
+            f'{"развёртывание":15}{"endpoint":24}{"запросов":>10}'
+            f'{"ошибок":>8}{"RPS":>10}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"p99, мс":>10}'
+        )
+        for name, deployment in results['deployments'].items():
+            for label, row in sorted(deployment['endpoints'].items()):
+                print(
+                    f'{name:15}{label:24}{row["requests"]:>10}'
+                    f'{row["errors"]:>8}{row["throughput"]:>10}'
+                    f'{row["p50_ms"]:>10}{row["p95_ms"]:>10}'
+                    f'{row["p99_ms"]:>10}'
+                )
+        print(
+            'slow_download - медленные клиенты, в total они не входят.'
+        )
+
+
+class Server:
+    """ gunicorn в отдельном процессе на время замера. """
+
+    def __init__(self, command, env, cwd, port):
+        self.command = command
+        self.env = env
+        self.cwd = cwd
+        self.url = f'http://127.0.0.1:{port}/api/tags/'
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            self.command, env=self.env, cwd=self.cwd,
+        )
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError('gunicorn завершился при запуске.')
+            try:
+                with urlopen(self.url, timeout=1):
+                    return self
+            except (URLError, OSError):
+                time.sleep(0.2)
+        self.__exit__()
+        raise CommandError('gunicorn не ответил за отведённое время.')
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.wait()
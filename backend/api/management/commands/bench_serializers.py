@@ -0,0 +1,111 @@
+import time
+from statistics import median
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.read_serializers import (
+    IngredientReadSerializer,
+    RecipeReadSerializer,
+    TagReadSerializer,
+    UserReadSerializer,
+)
+from api.renderers import FastJSONRenderer
+from api.serializers import (
+    IngredientSerializer,
+    RecipeSerializer,
+    TagSerializer,
+    UserSerializer,
+)
+from recipes.models import Ingredients, RecipeIngredients, Recipes, Tags, User
+
+ITERATIONS = 200
+PAGE_SIZE = 6
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает скорость сериализаторов DRF и сериализаторов '
+        'только для чтения на данных из базы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            default=ITERATIONS,
+            type=int,
+            help='Сколько раз выводить каждый набор данных.',
+        )
+        parser.add_argument(
+            '--page-size',
+            default=PAGE_SIZE,
+            type=int,
+            help='Количество рецептов и пользователей на странице.',
+        )
+
+    def handle(self, *args, **options):
+        # Ссылки на изображения строятся по хосту запроса фабрики.
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        ):
+            self.compare(options)
+
+    def compare(self, options):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = AnonymousUser()
+        context = {'request': request}
+        recipes = list(
+            Recipes.objects.select_related('author').prefetch_related(
+                'tags',
+                Prefetch(
+                    'recipe_ingredients',
+                    queryset=RecipeIngredients.objects.select_related(
+                        'ingredient'
+                    ),
+                ),
+            ).order_by('-pub_date')[:options['page_size']]
+        )
+        if not recipes:
+            raise CommandError('В базе нет рецептов.')
+        cases = (
+            ('рецепты, страница', recipes, True,
+             RecipeSerializer, RecipeReadSerializer),
+            ('рецепт', recipes[0], False,
+             RecipeSerializer, RecipeReadSerializer),
+            ('теги', list(Tags.objects.all()), True,
+             TagSerializer, TagReadSerializer),
+            ('ингредиенты', list(Ingredients.objects.all()), True,
+             IngredientSerializer, IngredientReadSerializer),
+            ('пользователи, страница',
+             list(User.objects.all()[:options['page_size']]), True,
+             UserSerializer, UserReadSerializer),
+        )
+        for name, instance, many, serializer_class, read_class in cases:
+            timings = []
+            contents = []
+            for serializer, renderer in (
+                (serializer_class, JSONRenderer()),
+                (read_class, FastJSONRenderer()),
+            ):
+                samples = []
+                for _ in range(options['iterations']):
+                    started = time.perf_counter()
+                    content = renderer.render(serializer(
+                        instance, many=many, context=dict(context),
+                    ).data)
+                    samples.append(time.perf_counter() - started)
+                timings.append(median(samples) * 1000)
+                contents.append(content)
+            if contents[0] != contents[1]:
+                raise CommandError(f'{name}: вывод отличается.')
+            print(
+                f'{name}: DRF {timings[0]:.3f} мс, '
+                f'чтение {timings[1]:.3f} мс, '
+                f'быстрее в {timings[0] / timings[1]:.1f} раза.'
+            )
@@ -0,0 +1,121 @@
+""" Гистограммы времени обработки запросов в формате Prometheus.
+
+Данные хранятся в памяти процесса: каждый воркер gunicorn отдаёт
+свои гистограммы, суммировать их - задача Prometheus.
+"""
+from bisect import bisect_left
+from threading import Lock
+
+from django.http import HttpResponse
+
+from .authentication import stats as token_cache_stats
+from .response_cache import stats as response_cache_stats
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Имя метрики: (описание, границы корзин).
+HISTOGRAMS = {
+    'foodgram_request_duration_seconds': (
+        'Время обработки запроса.', DURATION_BUCKETS,
+    ),
+    'foodgram_db_queries': (
+        'Количество запросов к базе за один запрос.', QUERY_BUCKETS,
+    ),
+    'foodgram_db_duration_seconds': (
+        'Время запросов к базе за один запрос.', DURATION_BUCKETS,
+    ),
+    'foodgram_serialization_duration_seconds': (
+        'Время рендеринга тела ответа.', DURATION_BUCKETS,
+    ),
+}
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def samples(self):
+        """ Накопительные значения корзин, как их ждёт Prometheus. """
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield str(bound), cumulative
+        yield '+Inf', self.count
+
+
+class Registry:
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms = {name: {} for name in HISTOGRAMS}
+
+    def observe(self, labels, values):
+        """ labels - пары (имя, значение), values - {метрика: значение}. """
+        with self.lock:
+            for name, value in values.items():
+                histogram = self.histograms[name].get(labels)
+                if histogram is None:
+                    histogram = self.histograms[name][labels] = Histogram(
+                        HISTOGRAMS[name][1]
+                    )
+                histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (help_text, _) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in sorted(
+                    self.histograms[name].items()
+                ):
+                    label_text = ','.join(
+                        f'{key}="{escape(value)}"' for key, value in labels
+                    )
+                    for bound, count in histogram.samples():
+                        lines.append(
+                            f'{name}_bucket{{{label_text},le="{bound}"}} '
+                            f'{count}'
+                        )
+                    lines.append(
+                        f'{name}_sum{{{label_text}}} {histogram.sum}'
+                    )
+                    lines.append(
+                        f'{name}_count{{{label_text}}} {histogram.count}'
+                    )
+        for prefix, stats in (
+            ('response_cache', response_cache_stats),
+            ('token_cache', token_cache_stats),
+        ):
+            cache_stats = stats.as_dict()
+            for key in ('hits', 'misses'):
+                name = f'foodgram_{prefix}_{key}_total'
+                lines.append(f'# TYPE {name} counter')
+                lines.append(f'{name} {cache_stats[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return (
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    )
+
+
+registry = Registry()
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,135 @@
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .db_router import (
+    get_replicas,
+    reads_from_replicas,
+    stick_to_primary,
+    use_replicas,
+)
+from .metrics import registry
+
+
+class QueryTimer:
+    """ Обёртка execute_wrapper: считает запросы к базе и их время. """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += perf_counter() - started
+
+
+def track_queries(timer):
+    """ Подключает timer к соединениям с базой текущего потока. """
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(timer))
+    return stack
+
+
+def view_label(view_func, method):
+    """ Имя представления и действия, например RecipeViewSet.list. """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__qualname__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class TelemetryMiddleware:
+    """ Время ответа, запросы к базе и рендеринг по представлениям.
+
+    Должен стоять первым в MIDDLEWARE, чтобы время ответа включало
+    остальные middleware. У потоковых ответов замер заканчивается,
+    когда отдан последний фрагмент.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = perf_counter()
+        timer = QueryTimer()
+        with track_queries(timer):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, request, started, timer,
+            )
+        else:
+            self.observe(request, started, timer)
+        return response
+
+    def stream(self, content, request, started, timer):
+        try:
+            # Под ASGI фрагменты читаются в другом потоке, у которого
+            # свои соединения с базой (см. handlers.py).
+            with track_queries(timer):
+                yield from content
+        finally:
+            self.observe(request, started, timer)
+
+    def observe(self, request, started, timer):
+        registry.observe(
+            (
+                ('view', getattr(request, 'telemetry_view', 'unresolved')),
+                ('method', request.method),
+            ),
+            {
+                'foodgram_request_duration_seconds':
+                    perf_counter() - started,
+                'foodgram_db_queries': timer.count,
+                'foodgram_db_duration_seconds': timer.duration,
+                'foodgram_serialization_duration_seconds':
+                    getattr(request, 'telemetry_render', 0),
+            },
+        )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.telemetry_view = view_label(
+            view_func, request.method.lower(),
+        )
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рендерятся сразу после этого вызова.
+        started = perf_counter()
+
+        def rendered(response):
+            request.telemetry_render = perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ReplicaMiddleware:
+    """ Разрешает безопасным запросам к API читать из реплик.
+
+    Потоковые ответы читаются уже после выхода из middleware, то есть
+    из основной базы.
+    """
+
+    def __init__(self, get_response):
+        if not get_replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = use_replicas.set(reads_from_replicas(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replicas.reset(token)
+        if request.method not in SAFE_METHODS:
+            stick_to_primary(request)
+        return response
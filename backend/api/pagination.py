@@ -1,5 +1,111 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(BasePagination):
+    """ Keyset-пагинация рецептов по (pub_date, id).
+
+    Включается параметром cursor, для первой страницы - пустым:
+    /api/recipes/?cursor=&limit=6. Страница выбирается по индексу
+    без OFFSET, поэтому любая страница стоит столько же, сколько первая.
+    Общее количество считается только по запросу ?count=1.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, recipe, reverse):
+        position = f'{recipe.pub_date.isoformat()}|{recipe.id}|{int(reverse)}'
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            urlsafe_b64encode(position.encode()).decode(),
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, pk, reverse = (
+                urlsafe_b64decode(encoded.encode()).decode().split('|')
+            )
+            return datetime.fromisoformat(pub_date), int(pk), reverse == '1'
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        self.count = (
+            queryset.count() if request.query_params.get('count') else None
+        )
+        reverse = False
+        ordering = ('-pub_date', '-id')
+        if cursor is not None:
+            pub_date, pk, reverse = cursor
+            # (pub_date, id) > или < курсора. Условие на один pub_date
+            # даёт базе границу диапазона по индексу (-pub_date, -id):
+            # одно OR она использовать так не может.
+            if reverse:
+                queryset = queryset.filter(
+                    Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=pk),
+                    pub_date__gte=pub_date,
+                )
+                ordering = ('pub_date', 'id')
+            else:
+                queryset = queryset.filter(
+                    Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk),
+                    pub_date__lte=pub_date,
+                )
+        results = list(queryset.order_by(*ordering)[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+        self.has_next = reverse or has_more
+        self.has_previous = has_more if reverse else cursor is not None
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        envelope = OrderedDict()
+        if self.count is not None:
+            envelope['count'] = self.count
+        envelope['next'] = self.get_next_link()
+        envelope['previous'] = self.get_previous_link()
+        envelope['results'] = data
+        return Response(envelope)
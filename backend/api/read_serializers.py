@@ -0,0 +1,159 @@
+""" Сериализаторы только для чтения без полей DRF.
+
+Выводят то же, что и сериализаторы из serializers.py, но собирают
+словари напрямую из объектов: на странице рецептов это в разы быстрее.
+Порядок ключей и значения должны совпадать с ModelSerializer байт в байт,
+поэтому при изменении полей нужно менять обе версии.
+"""
+from rest_framework.permissions import SAFE_METHODS
+
+from recipes.renditions import get_rendition
+from users.models import Subscribe
+from .serializers import UserSubscribeSerializer
+
+
+def file_url(file, request=None):
+    """ Как FileField.to_representation. """
+    if not file:
+        return None
+    if request is not None:
+        return request.build_absolute_uri(file.url)
+    return file.url
+
+
+def use_read_serializers(request):
+    """ Браузерному API нужны поля DRF для форм, клиентам JSON - нет. """
+    renderer = getattr(request, 'accepted_renderer', None)
+    return (
+        request.method in SAFE_METHODS
+        and renderer is not None
+        and renderer.format == 'json'
+    )
+
+
+class ReadSerializer:
+    """ Поддерживает то, чем пользуются представления: many, context, data.
+
+    По умолчанию выводит атрибуты объекта из fields в том же порядке.
+    """
+    fields = ()
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context if context is not None else {}
+
+    @property
+    def data(self):
+        if self.many:
+            return [self.to_representation(obj) for obj in self.instance]
+        return self.to_representation(self.instance)
+
+    def to_representation(self, instance):
+        return {field: getattr(instance, field) for field in self.fields}
+
+
+class TagReadSerializer(ReadSerializer):
+    fields = ('id', 'name', 'color', 'slug')
+
+
+class IngredientReadSerializer(ReadSerializer):
+    fields = ('id', 'name', 'measurement_unit')
+
+
+class UserReadSerializer(ReadSerializer):
+    fields = ('email', 'id', 'username', 'first_name', 'last_name')
+
+    def to_representation(self, user):
+        data = super().to_representation(user)
+        data['is_subscribed'] = self.is_subscribed(user)
+        return data
+
+    def is_subscribed(self, user):
+        is_subscribed = getattr(user, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
+        return user.id in self.get_subscriptions()
+
+    def get_subscriptions(self):
+        """ То же, что UserSerializer.get_subscriptions. """
+        if 'subscriptions' not in self.context:
+            user = self.context.get('request').user
+            self.context['subscriptions'] = (
+                set(
+                    Subscribe.objects.filter(user=user)
+                    .values_list('author_id', flat=True)
+                )
+                if user.is_authenticated
+                else set()
+            )
+        return self.context['subscriptions']
+
+
+class UserSubscribeReadSerializer(UserReadSerializer):
+    def to_representation(self, user):
+        data = super().to_representation(user)
+        recipes = getattr(user, 'limited_recipes', None)
+        if recipes is None:
+            recipe_limit = UserSubscribeSerializer.get_recipes_limit(
+                self.context['request']
+            )
+            recipes = user.author_recipes.all()
+            recipes = recipes[:recipe_limit] if recipe_limit else recipes
+        data['recipes'] = [
+            {
+                'id': recipe.id,
+                'name': recipe.name,
+                # FollowerRecipeSerializer работает без request,
+                # поэтому ссылка относительная.
+                'image': file_url(get_rendition(recipe, 'card')),
+                'cooking_time': recipe.cooking_time,
+            }
+            for recipe in recipes
+        ]
+        data['recipes_count'] = user.recipes_count
+        return data
+
+
+class RecipeReadSerializer(ReadSerializer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.author_serializer = UserReadSerializer(context=self.context)
+        self.tag_serializer = TagReadSerializer(context=self.context)
+        # Как RecipeImageField: в списке копия для карточки.
+        self.rendition = 'card' if self.many else 'detail'
+
+    def to_representation(self, recipe):
+        author = recipe.author
+        # Подписка на автора аннотирована в queryset рецептов.
+        is_subscribed = getattr(recipe, 'is_subscribed', None)
+        if is_subscribed is not None:
+            author.is_subscribed = is_subscribed
+        return {
+            'id': recipe.id,
+            'author': self.author_serializer.to_representation(author),
+            'name': recipe.name,
+            'image': file_url(
+                get_rendition(recipe, self.rendition),
+                self.context.get('request'),
+            ),
+            'text': recipe.text,
+            'ingredients': [
+                {
+                    'id': row.ingredient.id,
+                    'name': row.ingredient.name,
+                    'measurement_unit': row.ingredient.measurement_unit,
+                    'amount': row.amount,
+                }
+                for row in recipe.recipe_ingredients.all()
+            ],
+            'tags': [
+                self.tag_serializer.to_representation(tag)
+                for tag in recipe.tags.all()
+            ],
+            'cooking_time': recipe.cooking_time,
+            'is_in_shopping_cart': bool(
+                getattr(recipe, 'is_in_shopping_cart', False)
+            ),
+            'is_favorited': bool(getattr(recipe, 'is_favorited', False)),
+        }
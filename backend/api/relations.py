@@ -0,0 +1,323 @@
+""" Избранное, покупки и подписки: добавление и удаление связей.
+
+Связи вставляются одним INSERT ... SELECT, который ничего не делает
+при конфликте, и удаляются одним DELETE ... IN, и для одной связи,
+и для пакета. В PostgreSQL этот запрос обёрнут в CTE: тот же оператор
+меняет счётчик объекта и возвращает его поля для ответа. В других базах
+запрос выполняется по строке на id, изменения видны по числу затронутых
+строк, а счётчики меняются отдельным UPDATE. Все пути обходят сигналы
+моделей, поэтому счётчики и списки покупок обновляются здесь же и только
+для действительно изменённых строк.
+"""
+from contextlib import nullcontext
+
+from django.db import connections, router, transaction
+from django.db.models import Exists, OuterRef
+from django.http import Http404
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from recipes.models import (
+    Favourites,
+    Recipes,
+    ShoppingCart,
+    ShoppingListIngredients,
+)
+from users.counters import change_counters
+from users.models import CustomUser, Subscribe
+from .serializers import BatchSerializer
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+SELF = 'self'
+
+
+def returns_changes(connection):
+    """ Умеет ли база менять данные в CTE и возвращать строки. """
+    return connection.vendor == 'postgresql'
+
+
+class Relations:
+    """ Связи пользователя с объектами target через модель model.
+
+    key - поле связи с объектом, counter - его счётчик связей,
+    columns - поля объекта, которые нужны ответу на добавление связи.
+    """
+    # Запросы одного пользователя выполняются по очереди.
+    locks_user = False
+
+    def __init__(self, model, key, target, counter, columns=None):
+        self.model = model
+        self.key = key
+        self.target = target
+        self.counter = counter
+        self.columns = columns
+
+    @property
+    def connection(self):
+        return connections[router.db_for_write(self.model)]
+
+    def prepare(self, pk):
+        """ id объекта из URL, как его привёл бы фильтр ORM. """
+        return self.target._meta.pk.get_prep_value(pk)
+
+    def atomic(self):
+        """ Транзакция, если изменение связи - больше одного запроса. """
+        if self.locks_user or not returns_changes(self.connection):
+            return transaction.atomic(using=self.connection.alias)
+        return nullcontext()
+
+    def lock(self, user):
+        if self.locks_user:
+            list(
+                CustomUser.objects.select_for_update()
+                .filter(pk=user.pk).values_list('pk', flat=True)
+            )
+
+    def lookup(self, user, ids):
+        """ Найденные объекты: {id: есть ли уже связь}. """
+        return dict(
+            self.target.objects.filter(pk__in=ids).annotate(
+                linked=Exists(self.model.objects.filter(
+                    user=user, **{self.key: OuterRef('pk')}
+                )),
+            ).values_list('pk', 'linked')
+        )
+
+    def execute(self, sql, user, ids, delta):
+        """ Выполняет sql для ids и меняет счётчики на delta.
+
+        Возвращает {id: объект} для изменённых связей. Объект с полями
+        из columns есть только там, где их вернул сам запрос.
+        """
+        connection = self.connection
+        if returns_changes(connection):
+            return self.execute_returning(connection, sql, user, ids, delta)
+        changed = []
+        with connection.cursor() as cursor:
+            for pk in ids:
+                cursor.execute(sql.format(ids='%s'), [user.pk, pk])
+                if cursor.rowcount:
+                    changed.append(pk)
+        if changed:
+            change_counters(self.target, changed, self.counter, delta)
+        return dict.fromkeys(changed)
+
+    def execute_returning(self, connection, sql, user, ids, delta):
+        """ Связи, счётчик и поля объекта одним запросом. """
+        quote = connection.ops.quote_name
+        target = self.target._meta
+        table = quote(target.db_table)
+        key = quote(self.model._meta.get_field(self.key).column)
+        counter = quote(target.get_field(self.counter).column)
+        names = [target.pk.attname, *(self.columns or [])]
+        columns = ', '.join(
+            f'{table}.{quote(target.get_field(name).column)}'
+            for name in names
+        )
+        statement = (
+            f'WITH changed AS ('
+            f'{sql.format(ids=", ".join(["%s"] * len(ids)))} '
+            f'RETURNING {key}) '
+            f'UPDATE {table} SET {counter} = GREATEST({counter} + %s, 0) '
+            f'FROM changed '
+            f'WHERE {table}.{quote(target.pk.column)} = changed.{key} '
+            f'RETURNING {columns}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(statement, [user.pk, *ids, delta])
+            rows = cursor.fetchall()
+        if not self.columns:
+            return dict.fromkeys(row[0] for row in rows)
+        return {
+            row[0]: self.target.from_db(connection.alias, names, row)
+            for row in rows
+        }
+
+    def insert(self, user, ids):
+        """ Вставляет связи с существующими объектами из ids. """
+        ops = self.connection.ops
+        quote = ops.quote_name
+        meta = self.model._meta
+        target = self.target._meta
+        return self.execute(
+            f'{ops.insert_statement(ignore_conflicts=True)} '
+            f'{quote(meta.db_table)} ('
+            f'{quote(meta.get_field("user").column)}, '
+            f'{quote(meta.get_field(self.key).column)}'
+            f') SELECT %s, {quote(target.pk.column)} '
+            f'FROM {quote(target.db_table)} '
+            f'WHERE {quote(target.pk.column)} IN ({{ids}}) '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}',
+            user,
+            ids,
+            1,
+        )
+
+    def delete(self, user, ids):
+        """ Удаляет связи с объектами из ids. """
+        quote = self.connection.ops.quote_name
+        meta = self.model._meta
+        return self.execute(
+            f'DELETE FROM {quote(meta.db_table)} '
+            f'WHERE {quote(meta.get_field("user").column)} = %s '
+            f'AND {quote(meta.get_field(self.key).column)} IN ({{ids}})',
+            user,
+            ids,
+            -1,
+        )
+
+    def link(self, user, pk):
+        """ Добавляет одну связь, если объект есть, а связи ещё нет.
+
+        Возвращает статус и объект с полями из columns для ответа.
+        """
+        pk = self.prepare(pk)
+        with self.atomic():
+            self.lock(user)
+            inserted = self.insert(user, [pk])
+            if inserted:
+                self.added(user, [pk])
+        if inserted:
+            obj = inserted[pk]
+            if obj is None and self.columns:
+                obj = self.target.objects.only(*self.columns).get(pk=pk)
+            return ADDED, obj
+        # Ничего не вставлено: лишний запрос только на пути ошибки.
+        if self.target.objects.filter(pk=pk).exists():
+            return EXISTS, None
+        return NOT_FOUND, None
+
+    def unlink(self, user, pk):
+        """ Удаляет одну связь. """
+        pk = self.prepare(pk)
+        with self.atomic():
+            self.lock(user)
+            if not self.delete(user, [pk]):
+                return MISSING
+            self.removed(user, [pk])
+        return REMOVED
+
+    def add(self, user, ids):
+        with transaction.atomic(using=self.connection.alias):
+            self.lock(user)
+            found = self.lookup(user, ids)
+            new = [pk for pk in ids if pk in found and not found[pk]]
+            inserted = set(self.insert(user, new)) if new else set()
+            if inserted:
+                self.added(user, list(inserted))
+        return {
+            pk: (
+                NOT_FOUND if pk not in found
+                else ADDED if pk in inserted
+                else EXISTS
+            )
+            for pk in ids
+        }
+
+    def remove(self, user, ids):
+        with transaction.atomic(using=self.connection.alias):
+            self.lock(user)
+            found = self.lookup(user, ids)
+            linked = [pk for pk in ids if found.get(pk)]
+            deleted = set(self.delete(user, linked)) if linked else set()
+            if deleted:
+                self.removed(user, list(deleted))
+        return {
+            pk: (
+                NOT_FOUND if pk not in found
+                else REMOVED if pk in deleted
+                else MISSING
+            )
+            for pk in ids
+        }
+
+    def added(self, user, ids):
+        """ Что ещё меняется вместе с новыми связями. """
+
+    def removed(self, user, ids):
+        """ Что ещё меняется вместе с удалёнными связями. """
+
+
+class ShoppingCartRelations(Relations):
+    # Список покупок - несколько запросов к строкам пользователя:
+    # без блокировки параллельное удаление обнулившейся строки может
+    # потерять прибавку из соседнего запроса.
+    locks_user = True
+
+    def added(self, user, ids):
+        ShoppingListIngredients.objects.add_recipes(user.pk, ids)
+
+    def removed(self, user, ids):
+        ShoppingListIngredients.objects.remove_recipes(user.pk, ids)
+
+
+class SubscribeRelations(Relations):
+    def link(self, user, pk):
+        pk = self.prepare(pk)
+        if pk == user.pk:
+            return SELF, None
+        return super().link(user, pk)
+
+    def add(self, user, ids):
+        statuses = super().add(
+            user, [pk for pk in ids if pk != user.pk]
+        )
+        return {pk: statuses.get(pk, SELF) for pk in ids}
+
+
+# Поля FollowerRecipeSerializer.
+RECIPE_COLUMNS = ('name', 'image', 'image_card', 'cooking_time')
+
+favourites = Relations(
+    Favourites, 'recipe_id', Recipes, 'favourites_count', RECIPE_COLUMNS,
+)
+shopping_cart = ShoppingCartRelations(
+    ShoppingCart, 'recipe_id', Recipes, 'in_carts_count', RECIPE_COLUMNS,
+)
+subscriptions = SubscribeRelations(
+    Subscribe, 'author_id', CustomUser, 'followers_count',
+)
+
+
+def link_or_error(relations, serializer_class, user, pk):
+    """ link() для одиночного запроса: 404 или ошибка сериализатора.
+
+    Возвращает связанный объект.
+    """
+    status, obj = relations.link(user, pk)
+    if status == NOT_FOUND:
+        raise Http404
+    if status != ADDED:
+        raise ValidationError({
+            api_settings.NON_FIELD_ERRORS_KEY: [
+                serializer_class().error_messages[status]
+            ],
+        })
+    return obj
+
+
+def unlink_or_404(relations, user, pk):
+    if relations.unlink(user, pk) != REMOVED:
+        raise Http404
+
+
+def batch_response(relations, request):
+    """ POST добавляет связи с объектами из ids, DELETE удаляет.
+
+    В ответе статус каждого id в порядке запроса.
+    """
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    if request.method == 'POST':
+        statuses = relations.add(request.user, ids)
+    else:
+        statuses = relations.remove(request.user, ids)
+    return Response([
+        {'id': pk, 'status': statuses[pk]} for pk in ids
+    ])
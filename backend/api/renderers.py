@@ -0,0 +1,40 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS
+    # Даты, Decimal и ленивые строки выводит кодировщик DRF,
+    # как и в JSONRenderer.
+    | orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """ JSONRenderer на orjson с тем же компактным выводом.
+
+    Отступы и настройки, которые orjson не поддерживает, обрабатывает
+    стандартный JSONRenderer.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=ORJSON_OPTIONS,
+            )
+        except orjson.JSONEncodeError:
+            # NaN в строгом режиме, слишком большие целые и т.п.
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer экранирует их, чтобы JSON оставался подмножеством
+        # JavaScript.
+        return content.replace(
+            '\u2028'.encode(), b'\\u2028',
+        ).replace(
+            '\u2029'.encode(), b'\\u2029',
+        )
@@ -0,0 +1,112 @@
+from hashlib import md5
+from threading import Lock
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from django.core.cache import cache
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .catalogue import get_versions, primary_if_changed
+
+RESPONSE_TIMEOUT = 10 * 60
+# Параметры, от которых зависит общая часть ответа. С фильтрами
+# is_favorited и is_in_shopping_cart ответ личный и не кэшируется.
+CACHED_PARAMS = ('page', 'limit', 'tags', 'author', 'cursor', 'count')
+# Параметры, которыми ссылки next и previous отличаются от запроса.
+PAGE_PARAMS = ('page', 'cursor')
+# Справочники, данные которых попадают в ответ с рецептом.
+SHARED_VERSIONS = ('tags', 'ingredients', 'users')
+
+
+class CacheStats:
+    """ Попадания и промахи кэша в этом процессе. """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.hits = self.misses = 0
+
+    def add(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
+
+
+stats = CacheStats()
+
+
+def normalize_query(query_params):
+    """ Строка запроса без лишних параметров и с постоянным порядком. """
+    return urlencode([
+        (name, value)
+        for name in CACHED_PARAMS
+        for value in sorted(set(query_params.getlist(name)))
+    ])
+
+
+def relink(url, request):
+    """ Ссылка на соседнюю страницу от строки запроса request.
+
+    Ссылки в кэше построены по запросу первого клиента, а в нём могли
+    быть параметры, которых нет в ключе кэша.
+    """
+    if url is None:
+        return None
+    query = parse_qs(urlsplit(url).query, keep_blank_values=True)
+    link = request.build_absolute_uri()
+    for name in PAGE_PARAMS:
+        if name in query:
+            link = replace_query_param(link, name, query[name][0])
+        else:
+            link = remove_query_param(link, name)
+    return link
+
+
+def recipe_versions(pk=None):
+    """ Версии, которые сбрасываются при изменении рецептов.
+
+    Список зависит от всех рецептов, страница рецепта - только от него.
+    """
+    name = 'recipes' if pk is None else f'recipe:{pk}'
+    return get_versions(name, *SHARED_VERSIONS)
+
+
+def cached_response(request, versions, get_response):
+    """ Общий для всех пользователей ответ из кэша.
+
+    get_response не должен зависеть от пользователя запроса: личные
+    отметки накладываются поверх общих данных (см. user_flags).
+    В кэше хранятся данные ответа, а не готовый JSON, поэтому
+    формат по-прежнему выбирается по заголовку Accept.
+    """
+    key = md5(':'.join([
+        request.scheme,
+        request.get_host(),
+        request.path,
+        normalize_query(request.query_params),
+        *map(str, versions),
+    ]).encode()).hexdigest()
+    data = cache.get(f'response:{key}')
+    stats.add(data is not None)
+    if data is not None:
+        if isinstance(data, dict) and 'next' in data:
+            data['next'] = relink(data['next'], request)
+            data['previous'] = relink(data['previous'], request)
+        return Response(data, headers={'X-Cache': 'HIT'})
+    with primary_if_changed(versions):
+        response = get_response()
+    if response.status_code == 200:
+        cache.set(f'response:{key}', response.data, RESPONSE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
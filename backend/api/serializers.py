@@ -1,9 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import transaction
-from django.shortcuts import get_object_or_404
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator, ValidationError
+from rest_framework.validators import ValidationError
 
 from recipes.models import (
     Favourites,
@@ -11,12 +10,37 @@ from recipes.models import (
     RecipeIngredients,
     Recipes,
     ShoppingCart,
+    ShoppingListIngredients,
     Tags
 )
+from recipes.renditions import get_rendition
 from users.models import CustomUser, Subscribe
 
 User = get_user_model()
 
+MAX_BATCH_IDS = 100
+
+
+class RecipeImageField(Base64ImageField):
+    """ Изображение в base64 на запись, URL уменьшенной копии на чтение.
+
+    Без явного rendition в списках отдаётся копия для карточки,
+    для одного рецепта - копия для страницы рецепта.
+    """
+    def __init__(self, rendition=None, **kwargs):
+        self.rendition = rendition
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        rendition = self.rendition
+        if rendition is None:
+            in_list = isinstance(
+                getattr(self.parent, 'parent', None),
+                serializers.ListSerializer,
+            )
+            rendition = 'card' if in_list else 'detail'
+        return get_rendition(instance, rendition)
+
 
 class UserCreateCustomSerializer(serializers.ModelSerializer):
     class Meta:
@@ -58,15 +82,33 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if not user.is_authenticated:
-            return False
-        return Subscribe.objects.filter(user=user, author=obj.id).exists()
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
+        return obj.id in self.get_subscriptions()
+
+    def get_subscriptions(self):
+        """ Id авторов, на которых подписан пользователь запроса.
+
+        Загружаются одним запросом и кэшируются в контексте корневого
+        сериализатора, поэтому вложенные сериализаторы их переиспользуют.
+        """
+        if 'subscriptions' not in self.context:
+            user = self.context.get('request').user
+            self.context['subscriptions'] = (
+                set(
+                    Subscribe.objects.filter(user=user)
+                    .values_list('author_id', flat=True)
+                )
+                if user.is_authenticated
+                else set()
+            )
+        return self.context['subscriptions']
 
 
 class UserSubscribeSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(source='author_recipes.count')
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -81,20 +123,24 @@ class UserSubscribeSerializer(UserSerializer):
             'recipes_count',
         )
 
-    def get_recipes(self, obj):
-        recipe_limit = 0
+    @staticmethod
+    def get_recipes_limit(request):
         try:
-            recipe_limit = int(
-                self.context['request'].GET.get('recipes_limit', 0))
+            return max(int(request.GET.get('recipes_limit', 0)), 0)
         except ValueError:
-            pass
-        recipes = obj.author_recipes.all()
-        recipes = recipes[:recipe_limit] if recipe_limit else recipes
+            return 0
+
+    def get_recipes(self, obj):
+        recipes = getattr(obj, 'limited_recipes', None)
+        if recipes is None:
+            recipe_limit = self.get_recipes_limit(self.context['request'])
+            recipes = obj.author_recipes.all()
+            recipes = recipes[:recipe_limit] if recipe_limit else recipes
         return FollowerRecipeSerializer(recipes, many=True).data
 
 
 class FollowerRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = RecipeImageField(rendition='card')
 
     class Meta:
         model = Recipes
@@ -131,7 +177,9 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
 
 class CreateRecipeIngredientsSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredients.objects.all())
+    # Существование ингредиентов проверяется одним запросом
+    # в RecipeCreateSerializer.validate_ingredients.
+    id = serializers.IntegerField(source='ingredient_id')
     amount = serializers.IntegerField(min_value=1)
 
     class Meta:
@@ -147,7 +195,7 @@ class CreateRecipeIngredientsSerializer(serializers.ModelSerializer):
 
 
 class RecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = RecipeImageField()
     author = UserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     ingredients = RecipeIngredientSerializer(
@@ -177,6 +225,13 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_shopping_cart',
         )
 
+    def to_representation(self, instance):
+        # Подписка на автора аннотирована в queryset рецептов.
+        is_subscribed = getattr(instance, 'is_subscribed', None)
+        if is_subscribed is not None:
+            instance.author.is_subscribed = is_subscribed
+        return super().to_representation(instance)
+
 
 class RecipeCreateSerializer(RecipeSerializer):
     tags = serializers.PrimaryKeyRelatedField(
@@ -195,6 +250,21 @@ class RecipeCreateSerializer(RecipeSerializer):
             )
         return cooking_time
 
+    def validate_ingredients(self, ingredients):
+        ingredient_ids = {
+            ingredient['ingredient_id'] for ingredient in ingredients
+        }
+        missing = ingredient_ids - set(
+            Ingredients.objects.filter(id__in=ingredient_ids)
+            .values_list('id', flat=True)
+        )
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: '
+                f'{", ".join(map(str, sorted(missing)))}.'
+            )
+        return ingredients
+
     def validate(self, data):
         ingredients = data.get('recipe_ingredients')
         ingredients_temp_struct = set()
@@ -203,7 +273,7 @@ class RecipeCreateSerializer(RecipeSerializer):
                 raise serializers.ValidationError(
                     'В рецепте должны быть ингредиенты.'
                 )
-            ingredient_id = ingredient.get('id')
+            ingredient_id = ingredient.get('ingredient_id')
             if ingredient_id in ingredients_temp_struct:
                 raise serializers.ValidationError(
                     'Ингредиент можно добавить только один раз.'
@@ -222,14 +292,55 @@ class RecipeCreateSerializer(RecipeSerializer):
         ingredients_in_recipe = [
             RecipeIngredients(
                 recipe=recipe,
-                ingredient=get_object_or_404(Ingredients,
-                                             pk=ingredient['id'].id),
+                ingredient_id=ingredient['ingredient_id'],
                 amount=ingredient.get('amount'),
             )
             for ingredient in ingredients
         ]
         RecipeIngredients.objects.bulk_create(ingredients_in_recipe)
 
+    @staticmethod
+    def update_ingredients(ingredients, recipe):
+        """ Записывает только изменившиеся ингредиенты рецепта. """
+        amounts = {
+            ingredient['ingredient_id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {
+            row.ingredient_id: row
+            for row in RecipeIngredients.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in current.items()
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            RecipeIngredients.objects.filter(
+                recipe=recipe, ingredient_id__in=removed,
+            ).delete()
+        changed = []
+        for ingredient_id, row in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            RecipeIngredients.objects.bulk_update(changed, ['amount'])
+        added = [
+            RecipeIngredients(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        if added:
+            RecipeIngredients.objects.bulk_create(added)
+        ShoppingListIngredients.objects.update_recipe(
+            recipe.id, old_amounts, amounts,
+        )
+
     @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('recipe_ingredients')
@@ -244,8 +355,7 @@ class RecipeCreateSerializer(RecipeSerializer):
         ingredients = validated_data.pop('recipe_ingredients')
         tags = validated_data.pop('tags')
         instance.tags.set(tags)
-        RecipeIngredients.objects.filter(recipe=instance).delete()
-        self.add_ingredients(ingredients, instance)
+        self.update_ingredients(ingredients, instance)
         return super().update(instance, validated_data)
 
     class Meta:
@@ -261,19 +371,18 @@ class RecipeCreateSerializer(RecipeSerializer):
 
 
 class FavouriteSerializer(serializers.ModelSerializer):
-    recipe = serializers.PrimaryKeyRelatedField(queryset=Recipes.objects.all())
-    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    """ Ответ на добавление в избранное.
+
+    Связь создаёт api.relations, сообщения об ошибках - отсюда.
+    """
+    default_error_messages = {
+        'exists': 'Уже есть в избранном.',
+    }
 
     class Meta:
         model = Favourites
         fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Favourites.objects.all(),
-                fields=('user', 'recipe',),
-                message='Уже есть в избранном.',
-            )
-        ]
+        read_only_fields = fields
 
     def to_representation(self, instance):
         return FollowerRecipeSerializer(
@@ -286,26 +395,7 @@ class ShoppingCartSerializer(FavouriteSerializer):
     class Meta:
         model = ShoppingCart
         fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=ShoppingCart.objects.all(),
-                fields=('user', 'recipe',),
-                message='Уже есть в избранном.',
-            )
-        ]
-
-    def validate(self, data):
-        request = self.context.get('request')
-        recipe_id = data['recipe'].id
-        purchase_exists = ShoppingCart.objects.filter(
-            user=request.user,
-            recipe__id=recipe_id,
-        ).exists()
-        if request.method == 'POST' and purchase_exists:
-            raise serializers.ValidationError(
-                'Рецепт уже есть в списке покупок.'
-            )
-        return data
+        read_only_fields = fields
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -380,9 +470,19 @@ class SubscribersSerializer(UserSerializer):
         return obj.author_recipes.count()
 
 
+class BatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_IDS,
+    )
+
+
 class SubscribeToUserSerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
-    author = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    default_error_messages = {
+        'exists': 'Вы уже подписаны.',
+        'self': 'Нельзя подписаться на самого себя.',
+    }
 
     class Meta:
         model = Subscribe
@@ -390,23 +490,4 @@ class SubscribeToUserSerializer(serializers.ModelSerializer):
             'user',
             'author',
         )
-
-    def validate(self, data):
-        request = self.context.get('request')
-        author_id = data['author'].id
-        subscribe_is_exists = Subscribe.objects.filter(
-            user=request.user,
-            author__id=author_id,
-        ).exists()
-
-        if request.method == 'POST':
-            if request.user.id == author_id:
-                raise serializers.ValidationError(
-                    'Нельзя подписаться на самого себя.'
-                )
-            if subscribe_is_exists:
-                raise serializers.ValidationError(
-                    'Вы уже подписаны.'
-                )
-
-        return data
+        read_only_fields = fields
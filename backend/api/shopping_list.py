@@ -0,0 +1,69 @@
+import csv
+import json
+
+from recipes.models import ShoppingListIngredients
+
+CHUNK_SIZE = 500
+
+
+class Echo:
+    """ Псевдо-буфер для csv.writer: возвращает строку вместо записи. """
+    def write(self, value):
+        return value
+
+
+def get_shopping_list(user):
+    """ Ингредиенты из списка покупок, читаемые серверным курсором. """
+    return (
+        ShoppingListIngredients.objects.filter(user=user)
+        .values(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount',
+        )
+        .order_by('ingredient__name')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def render_txt(ingredients):
+    for ingredient in ingredients:
+        yield (
+            f'{ingredient["ingredient__name"]} - '
+            f'{ingredient["amount"]} '
+            f'{ingredient["ingredient__measurement_unit"]} \n'
+        )
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['amount'],
+            ingredient['ingredient__measurement_unit'],
+        ))
+
+
+def render_json(ingredients):
+    yield '['
+    separator = ''
+    for ingredient in ingredients:
+        yield separator + json.dumps(
+            {
+                'name': ingredient['ingredient__name'],
+                'amount': ingredient['amount'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+            },
+            ensure_ascii=False,
+        )
+        separator = ','
+    yield ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json'),
+}
@@ -0,0 +1,84 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredients, RecipeIngredients, Recipes, Tags
+from recipes.renditions import renditions_ready
+from users.models import CustomUser
+from .authentication import invalidate_user_tokens
+from .catalogue import bump_version
+
+# Поля пользователя, которые выводятся вместе с рецептом.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+def bump_recipes_version(*recipe_ids):
+    bump_version('recipes', *(f'recipe:{pk}' for pk in recipe_ids))
+
+
+@receiver(post_save, sender=Tags)
+@receiver(post_delete, sender=Tags)
+def bump_tags_version(sender, **kwargs):
+    bump_version('tags')
+
+
+@receiver(post_save, sender=Ingredients)
+@receiver(post_delete, sender=Ingredients)
+def bump_ingredients_version(sender, **kwargs):
+    bump_version('ingredients')
+
+
+@receiver(post_save, sender=Recipes)
+@receiver(post_delete, sender=Recipes)
+def recipe_changed(sender, instance, **kwargs):
+    bump_recipes_version(instance.pk)
+
+
+@receiver(renditions_ready, sender=Recipes)
+def recipe_renditions_ready(sender, recipe_id, **kwargs):
+    bump_recipes_version(recipe_id)
+
+
+@receiver(post_save, sender=RecipeIngredients)
+@receiver(post_delete, sender=RecipeIngredients)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    bump_recipes_version(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipes.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_recipes_version(instance.pk)
+    elif pk_set:
+        bump_recipes_version(*pk_set)
+    else:
+        # post_clear со стороны тега: затронутые рецепты уже не найти.
+        bump_version('recipes', 'tags')
+
+
+@receiver(post_save, sender=CustomUser)
+def user_changed(sender, instance, created, update_fields, **kwargs):
+    # У нового пользователя ещё нет рецептов, а вход обновляет только
+    # last_login - это не повод сбрасывать кэш.
+    if created:
+        return
+    # Смена пароля, деактивация и правка профиля: request.user из кэша
+    # токенов должен быть свежим.
+    invalidate_user_tokens(instance.pk)
+    if update_fields is None or AUTHOR_FIELDS & set(update_fields):
+        bump_version('users')
+        Recipes.objects.filter(author=instance).touch()
+
+
+@receiver(post_delete, sender=CustomUser)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_user_tokens(instance.pk)
+    bump_version('users')
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    # Выход через djoser удаляет токен.
+    invalidate_user_tokens(instance.user_id)
@@ -0,0 +1,468 @@
+import time
+from collections import Counter
+from contextlib import ExitStack, redirect_stdout
+from functools import partial
+from io import StringIO
+from unittest import skipUnless
+from urllib.parse import parse_qs, urlsplit
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Favourites,
+    Ingredients,
+    RecipeIngredients,
+    Recipes,
+    ShoppingCart,
+    ShoppingListIngredients,
+    Tags,
+    User,
+)
+from api.catalogue import bump_version
+from api.db_router import PRIMARY, PRIMARY_MODELS, get_replicas
+from users.models import Subscribe
+
+RECIPES = 12
+STICKY_SECONDS = 1
+
+
+# Данные TestCase не зафиксированы, и реплики-зеркала их не видят: всё
+# читается из основной базы, маршрутизацию проверяет ReplicaRoutingTest.
+@override_settings(DATABASE_ROUTERS=[])
+class RecipeQueryCountTest(TestCase):
+    """ Число запросов к базе на чтение рецептов не зависит от размера
+    страницы: авторы, теги и ингредиенты загружаются разом.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читатель', password='pass',
+        )
+        authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                first_name='Автор', last_name=str(number), password='pass',
+            )
+            for number in range(3)
+        ]
+        tags = [
+            Tags.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}',
+            )
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredients.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г',
+            )
+            for number in range(5)
+        ]
+        for number in range(RECIPES):
+            recipe = Recipes.objects.create(
+                author=authors[number % len(authors)],
+                name=f'Рецепт {number}',
+                text='Описание.',
+                cooking_time=10,
+            )
+            recipe.tags.set(tags[:number % len(tags) + 1])
+            RecipeIngredients.objects.bulk_create(
+                RecipeIngredients(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1,
+                )
+                for ingredient in ingredients[:number % len(ingredients) + 1]
+            )
+            if number % 2:
+                Favourites.objects.create(user=cls.user, recipe=recipe)
+        Subscribe.objects.create(user=cls.user, author=authors[0])
+        cls.recipe = Recipes.objects.order_by('id').first()
+
+    def setUp(self):
+        # Ответы и версии кэшируются: каждый тест начинает с промаха.
+        cache.clear()
+        self.anonymous = APIClient()
+        self.reader = APIClient()
+        self.reader.force_authenticate(self.user)
+
+    def assert_queries(self, client, url, count):
+        with self.assertNumQueries(count):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list(self):
+        for client, count in ((self.anonymous, 4), (self.reader, 5)):
+            for limit in (2, RECIPES):
+                with self.subTest(authenticated=client is self.reader,
+                                  limit=limit):
+                    cache.clear()
+                    response = self.assert_queries(
+                        client, f'/api/recipes/?limit={limit}', count,
+                    )
+                    self.assertEqual(len(response.data['results']), limit)
+
+    def test_retrieve(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        for client, count in ((self.anonymous, 4), (self.reader, 5)):
+            with self.subTest(authenticated=client is self.reader):
+                cache.clear()
+                self.assert_queries(client, url, count)
+
+
+class RecipeDeletionTest(TestCase):
+    """ Удаление рецепта правит списки покупок всех его корзин разом. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{number}', email=f'user{number}@example.com',
+                first_name='Имя', last_name='Фамилия', password='pass',
+            )
+            for number in range(4)
+        ]
+        cls.salt, cls.sugar = (
+            Ingredients.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'сахар')
+        )
+
+    def create_recipe(self, name, amounts, buyers):
+        recipe = Recipes.objects.create(
+            author=self.users[0], name=name, text='Описание.',
+            cooking_time=10,
+        )
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
+                recipe=recipe, ingredient=ingredient, amount=amount,
+            )
+            for ingredient, amount in amounts.items()
+        )
+        for user in buyers:
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+            Favourites.objects.create(user=user, recipe=recipe)
+        return recipe
+
+    def shopping_lists(self):
+        return set(ShoppingListIngredients.objects.values_list(
+            'user__username', 'ingredient__name', 'amount',
+        ))
+
+    def delete(self, recipe):
+        with CaptureQueriesContext(connection) as queries:
+            recipe.delete()
+        return len(queries)
+
+    def test_shopping_lists(self):
+        soup = self.create_recipe(
+            'Суп', {self.salt: 5, self.sugar: 1}, self.users[1:],
+        )
+        self.create_recipe('Чай', {self.sugar: 2}, self.users[1:2])
+        self.delete(soup)
+        self.assertEqual(self.shopping_lists(), {('user1', 'сахар', 2)})
+        self.assertEqual(
+            User.objects.get(pk=self.users[0].pk).recipes_count, 1,
+        )
+
+    def test_queries_do_not_depend_on_carts(self):
+        amounts = {self.salt: 5, self.sugar: 1}
+        self.assertEqual(
+            self.delete(self.create_recipe('Суп', amounts, self.users[:1])),
+            self.delete(self.create_recipe('Суп', amounts, self.users)),
+        )
+
+    def test_queryset_delete(self):
+        for name in ('Суп', 'Каша'):
+            self.create_recipe(name, {self.salt: 1}, self.users[1:3])
+        Recipes.objects.all().delete()
+        self.assertEqual(self.shopping_lists(), set())
+
+
+@override_settings(DATABASE_ROUTERS=[])
+class RelationsTest(TestCase):
+    """ Повторные и пакетные изменения связей меняют счётчики и списки
+    покупок только для действительно изменённых строк.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                first_name='Имя', last_name='Фамилия', password='pass',
+            )
+            for name in ('buyer', 'author')
+        )
+        salt, sugar = (
+            Ingredients.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'сахар')
+        )
+        cls.salt, cls.sugar = salt.id, sugar.id
+        cls.soup, cls.tea, cls.pie = (
+            Recipes.objects.create(
+                author=cls.author, name=name, text='Описание.',
+                cooking_time=10,
+            )
+            for name in ('Суп', 'Чай', 'Пирог')
+        )
+        RecipeIngredients.objects.bulk_create([
+            RecipeIngredients(recipe=cls.soup, ingredient=salt, amount=5),
+            RecipeIngredients(recipe=cls.soup, ingredient=sugar, amount=1),
+            RecipeIngredients(recipe=cls.tea, ingredient=sugar, amount=2),
+            RecipeIngredients(recipe=cls.pie, ingredient=sugar, amount=3),
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def counters(self, field):
+        return dict(Recipes.objects.values_list('name', field))
+
+    def shopping_list(self):
+        return dict(ShoppingListIngredients.objects.filter(
+            user=self.user,
+        ).values_list('ingredient_id', 'amount'))
+
+    def test_double_link(self):
+        url = f'/api/recipes/{self.soup.id}/favorite/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['name'], 'Суп')
+        self.assertEqual(response.data['cooking_time'], 10)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(
+            self.counters('favourites_count'),
+            {'Суп': 1, 'Чай': 0, 'Пирог': 0},
+        )
+        self.assertEqual(
+            self.client.post('/api/recipes/0/favorite/').status_code, 404,
+        )
+
+    def test_double_link_cart(self):
+        url = f'/api/recipes/{self.soup.id}/shopping_cart/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.counters('in_carts_count')['Суп'], 1)
+        self.assertEqual(self.shopping_list(), {self.salt: 5, self.sugar: 1})
+
+    def test_double_unlink(self):
+        url = f'/api/recipes/{self.tea.id}/shopping_cart/'
+        self.client.post(f'/api/recipes/{self.soup.id}/shopping_cart/')
+        self.client.post(url)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(
+            self.counters('in_carts_count'),
+            {'Суп': 1, 'Чай': 0, 'Пирог': 0},
+        )
+        self.assertEqual(self.shopping_list(), {self.salt: 5, self.sugar: 1})
+
+    def test_double_subscribe(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_mixed_batches(self):
+        url = '/api/recipes/shopping_cart/batch/'
+        missing = self.pie.id + 1
+        self.client.post(f'/api/recipes/{self.soup.id}/shopping_cart/')
+        response = self.client.post(
+            url, {'ids': [self.soup.id, self.tea.id, missing, self.tea.id]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [
+            {'id': self.soup.id, 'status': 'exists'},
+            {'id': self.tea.id, 'status': 'added'},
+            {'id': missing, 'status': 'not_found'},
+        ])
+        self.assertEqual(
+            self.counters('in_carts_count'),
+            {'Суп': 1, 'Чай': 1, 'Пирог': 0},
+        )
+        self.assertEqual(self.shopping_list(), {self.salt: 5, self.sugar: 3})
+        response = self.client.delete(
+            url, {'ids': [self.soup.id, self.pie.id, missing]}, format='json',
+        )
+        self.assertEqual(response.data, [
+            {'id': self.soup.id, 'status': 'removed'},
+            {'id': self.pie.id, 'status': 'missing'},
+            {'id': missing, 'status': 'not_found'},
+        ])
+        self.assertEqual(
+            self.counters('in_carts_count'),
+            {'Суп': 0, 'Чай': 1, 'Пирог': 0},
+        )
+        self.assertEqual(self.shopping_list(), {self.sugar: 2})
+        self.assertEqual(
+            set(ShoppingCart.objects.values_list('recipe__name', flat=True)),
+            {'Чай'},
+        )
+
+
+# Как RecipeQueryCountTest: реплики не видят данных TestCase.
+@override_settings(DATABASE_ROUTERS=[])
+class RecipeListCacheTest(TestCase):
+    """ Ссылки на соседние страницы в ответе из кэша строятся
+    по запросу текущего клиента.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Автор', password='pass',
+        )
+        Recipes.objects.bulk_create(
+            Recipes(
+                author=author, name=f'Рецепт {number}', text='Описание.',
+                cooking_time=10,
+            )
+            for number in range(5)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_page_links(self):
+        first = self.get('/api/recipes/?limit=2&junk=1')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertIn('junk=1', first.data['next'])
+        response = self.get('/api/recipes/?page=2&limit=2')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        response = self.get('/api/recipes/?limit=2')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(
+            response.data['next'],
+            'http://testserver/api/recipes/?limit=2&page=2',
+        )
+        self.assertIsNone(response.data['previous'])
+        response = self.get('/api/recipes/?limit=2&page=2&other=1')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(
+            response.data['previous'],
+            'http://testserver/api/recipes/?limit=2&other=1',
+        )
+
+    def test_cursor_links(self):
+        first = self.get('/api/recipes/?cursor=&limit=2&junk=1')
+        response = self.get('/api/recipes/?limit=2&cursor=')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertNotIn('junk', response.data['next'])
+        self.assertEqual(
+            parse_qs(urlsplit(response.data['next']).query)['cursor'],
+            parse_qs(urlsplit(first.data['next']).query)['cursor'],
+        )
+
+
+def record(queries, tables, alias, execute, sql, params, many, context):
+    # Токен и сессия всегда читаются из основной базы, их не считаем.
+    if not any(table in sql for table in tables):
+        queries[alias] += 1
+    return execute(sql, params, many, context)
+
+
+@skipUnless(get_replicas(), 'Реплики не настроены: задайте DB_REPLICA_HOSTS.')
+@override_settings(REPLICA_STICKY_SECONDS=STICKY_SECONDS)
+class ReplicaRoutingTest(TransactionTestCase):
+    """ Чтение API уходит в реплики, запись - в основную базу, а после
+    записи клиент читает из основной базы.
+
+    В тестах реплики зеркалируют основную базу (TEST MIRROR), но
+    подключаются под своими алиасами, поэтому по алиасу видно, куда ушёл
+    каждый запрос. Зеркало - отдельное подключение и видит только
+    зафиксированные данные, поэтому здесь TransactionTestCase.
+    """
+    databases = {PRIMARY, *get_replicas()}
+
+    def setUp(self):
+        cache.clear()
+        with redirect_stdout(StringIO()):
+            call_command('generate_data', users=3, recipes=10, seed=0)
+        user = User.objects.order_by('id').first()
+        token = Token.objects.create(user=user).key
+        self.first, self.second = Recipes.objects.exclude(
+            id__in=Favourites.objects.filter(user=user).values('recipe'),
+        ).order_by('id')[:2]
+        self.anonymous = APIClient()
+        self.author = APIClient(HTTP_AUTHORIZATION=f'Token {token}')
+        # Версии кэша только что сброшены генератором.
+        time.sleep(STICKY_SECONDS)
+
+    def request(self, client, method, url):
+        """ Число запросов к базе по алиасам. """
+        queries = Counter()
+        tables = [
+            apps.get_model(label)._meta.db_table for label in PRIMARY_MODELS
+        ]
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(
+                    partial(record, queries, tables, alias)
+                ))
+            response = getattr(client, method)(url)
+        self.assertLess(response.status_code, 400, url)
+        return queries
+
+    def assert_reads_from(self, expected, client, url, method='get'):
+        queries = self.request(client, method, url)
+        on_primary = queries.pop(PRIMARY, 0)
+        on_replicas = sum(queries.values())
+        if expected == 'replica':
+            self.assertTrue(on_replicas, url)
+            self.assertEqual(on_primary, 0, url)
+        else:
+            self.assertTrue(on_primary, url)
+            self.assertEqual(on_replicas, 0, url)
+
+    def test_reads_go_to_replicas(self):
+        self.assert_reads_from('replica', self.anonymous, '/api/recipes/')
+        self.assert_reads_from(
+            'replica', self.anonymous, f'/api/recipes/{self.first.id}/',
+        )
+        self.assert_reads_from(
+            'replica', self.anonymous, '/api/ingredients/?name=а',
+        )
+        self.assert_reads_from(
+            'replica', self.author, '/api/users/subscriptions/?limit=6',
+        )
+
+    def test_client_sticks_to_primary_after_write(self):
+        self.assert_reads_from(
+            'primary', self.author,
+            f'/api/recipes/{self.second.id}/favorite/', method='post',
+        )
+        self.assert_reads_from(
+            'primary', self.author, '/api/recipes/?is_favorited=1',
+        )
+        time.sleep(STICKY_SECONDS)
+        self.assert_reads_from(
+            'replica', self.author, '/api/recipes/?is_favorited=1',
+        )
+
+    def test_recently_changed_data_is_read_from_primary(self):
+        # Рецепты изменены, например, в админке: закэшировать ленту
+        # из отстающей реплики нельзя.
+        bump_version('recipes')
+        self.assert_reads_from('primary', self.anonymous, '/api/recipes/')
@@ -0,0 +1,63 @@
+from django.db.models import CharField, Value
+
+from recipes.models import Favourites, ShoppingCart
+from users.models import Subscribe
+
+
+def get_user_flags(user, recipe_ids, author_ids):
+    """ Избранное, покупки и подписки пользователя среди данных страницы.
+
+    Все три множества загружаются одним запросом.
+    """
+    flags = {
+        'favorite': set(),
+        'shopping_cart': set(),
+        'subscribe': set(),
+    }
+    rows = Favourites.objects.filter(
+        user=user, recipe_id__in=recipe_ids,
+    ).annotate(
+        kind=Value('favorite', CharField()),
+    ).values_list('kind', 'recipe_id').union(
+        ShoppingCart.objects.filter(
+            user=user, recipe_id__in=recipe_ids,
+        ).annotate(
+            kind=Value('shopping_cart', CharField()),
+        ).values_list('kind', 'recipe_id'),
+        Subscribe.objects.filter(
+            user=user, author_id__in=author_ids,
+        ).annotate(
+            kind=Value('subscribe', CharField()),
+        ).values_list('kind', 'author_id'),
+        all=True,
+    )
+    for kind, pk in rows:
+        flags[kind].add(pk)
+    return flags
+
+
+def overlay_user_flags(user, data):
+    """ Проставляет личные отметки в общих данных рецептов.
+
+    data - один рецепт, их список или страница с ними в results.
+    """
+    if isinstance(data, list):
+        recipes = data
+    else:
+        recipes = data['results'] if 'results' in data else [data]
+    if not recipes or user.is_anonymous:
+        return data
+    flags = get_user_flags(
+        user,
+        {recipe['id'] for recipe in recipes},
+        {recipe['author']['id'] for recipe in recipes},
+    )
+    for recipe in recipes:
+        recipe['is_favorited'] = recipe['id'] in flags['favorite']
+        recipe['is_in_shopping_cart'] = (
+            recipe['id'] in flags['shopping_cart']
+        )
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in flags['subscribe']
+        )
+    return data
@@ -1,11 +1,22 @@
-from django.db.models import Exists, OuterRef, Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+from collections import defaultdict
+
+from django.db.models import (
+    BooleanField,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Value,
+    Window,
+)
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import (
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
@@ -22,36 +33,70 @@ from recipes.models import (
     User,
 )
 from users.models import CustomUser, Subscribe
-from .filters import RecipeFilter, IngredientFilter
-from .pagination import CustomPagination
+from .catalogue import catalogue_response
+from .conditional import conditional_response, make_etag
+from .filters import RecipeFilter
+from .ingredient_index import ingredient_index
+from .pagination import CustomPagination, RecipeCursorPagination
+from .read_serializers import (
+    IngredientReadSerializer,
+    RecipeReadSerializer,
+    TagReadSerializer,
+    UserReadSerializer,
+    UserSubscribeReadSerializer,
+    use_read_serializers,
+)
+from .relations import (
+    batch_response,
+    favourites,
+    link_or_error,
+    shopping_cart,
+    subscriptions,
+    unlink_or_404,
+)
+from .response_cache import cached_response, recipe_versions, stats
 from .serializers import (
     FavouriteSerializer,
-    IngredientSerializer,
     RecipeSerializer,
     ShoppingCartSerializer,
-    TagSerializer,
     RecipeCreateSerializer,
     UserSubscribeSerializer,
     UserSerializer,
     SubscribeToUserSerializer,
 )
+from .shopping_list import SHOPPING_LIST_FORMATS, get_shopping_list
+from .user_flags import overlay_user_flags
 
 
 class TagViewSet(ReadOnlyModelViewSet):
     queryset = Tags.objects.all()
-    serializer_class = TagSerializer
+    serializer_class = TagReadSerializer
     pagination_class = None
     permission_classes = [IsAuthenticatedOrReadOnly, ]
 
+    def list(self, request, *args, **kwargs):
+        return catalogue_response(
+            request,
+            'tags',
+            lambda: self.get_serializer(self.get_queryset(), many=True).data,
+        )
+
 
 class IngredientViewSet(ReadOnlyModelViewSet):
     queryset = Ingredients.objects.all()
-    serializer_class = IngredientSerializer
-    search_fields = ('^name',)
-    filter_backends = (IngredientFilter,)
+    serializer_class = IngredientReadSerializer
     pagination_class = None
     permission_classes = [IsAuthenticatedOrReadOnly, ]
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name', '')
+        return catalogue_response(
+            request,
+            'ingredients',
+            lambda: ingredient_index.search(name),
+            variant=name.casefold(),
+        )
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipes.objects.all()
@@ -60,34 +105,146 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly, ]
     filter_class = RecipeFilter
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if 'cursor' in self.request.query_params:
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    @property
+    def shared_payload(self):
+        """ Ответ собирается без данных пользователя и кэшируется.
+
+        Личные отметки накладываются потом; только фильтры по избранному
+        и списку покупок делают сам список личным.
+        """
+        if self.action not in ['list', 'retrieve']:
+            return False
+        return self.request.user.is_anonymous or not (
+            self.request.GET.get('is_favorited')
+            or self.request.GET.get('is_in_shopping_cart')
+        )
+
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
+            if use_read_serializers(self.request):
+                return RecipeReadSerializer
             return RecipeSerializer
         return super().get_serializer_class()
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.shared_payload:
+            # Подписки на авторов накладываются поверх общего ответа.
+            context['subscriptions'] = set()
+        return context
+
     def get_queryset(self):
         user = self.request.user
-        if user.is_anonymous:
-            return Recipes.objects.all()
-        recipes = Recipes.objects.annotate(
-            is_favorited=Exists(
+        recipes = Recipes.objects.all()
+        if self.action in ['list', 'retrieve']:
+            recipes = recipes.select_related('author').prefetch_related(
+                'tags',
+                Prefetch(
+                    'recipe_ingredients',
+                    queryset=RecipeIngredients.objects.select_related(
+                        'ingredient'
+                    ),
+                ),
+            )
+        if user.is_anonymous or self.shared_payload:
+            return recipes
+        recipes = recipes.annotate(**self.user_flags(user))
+        if self.request.GET.get('is_favorited'):
+            return recipes.filter(is_favorited=True)
+        elif self.request.GET.get('is_in_shopping_cart'):
+            return recipes.filter(is_in_shopping_cart=True)
+        return recipes
+
+    @staticmethod
+    def user_flags(user):
+        return {
+            'is_favorited': Exists(
                 Favourites.objects.filter(
                     user=user,
                     recipe_id=OuterRef('pk'),
                 )
             ),
-            is_in_shopping_cart=Exists(
+            'is_in_shopping_cart': Exists(
                 ShoppingCart.objects.filter(
                     user=user,
                     recipe_id=OuterRef('pk'),
                 )
             ),
+            'is_subscribed': Exists(
+                Subscribe.objects.filter(
+                    user=user,
+                    author_id=OuterRef('author_id'),
+                )
+            ),
+        }
+
+    def list(self, request, *args, **kwargs):
+        if not self.shared_payload:
+            return super().list(request, *args, **kwargs)
+        return self.overlay_user_flags(cached_response(
+            request,
+            recipe_versions(),
+            lambda: super(RecipeViewSet, self).list(request, *args, **kwargs),
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        def get_response():
+            return self.overlay_user_flags(cached_response(
+                request,
+                recipe_versions(kwargs['pk']),
+                lambda: super(RecipeViewSet, self).retrieve(
+                    request, *args, **kwargs
+                ),
+            ))
+
+        try:
+            version = self.recipe_version(kwargs['pk'])
+        except (TypeError, ValueError):
+            # Нечисловой id: 404 вернёт обычный retrieve.
+            version = None
+        if version is None:
+            return get_response()
+        updated_at, *flags = version
+        # Личные отметки не имеют даты изменения: для пользователя
+        # ответ сверяется только по ETag.
+        return conditional_response(
+            request,
+            get_response,
+            make_etag(request, updated_at.isoformat(), *flags),
+            updated_at if request.user.is_anonymous else None,
         )
-        if self.request.GET.get('is_favorited'):
-            return recipes.filter(is_favorited=True)
-        elif self.request.GET.get('is_in_shopping_cart'):
-            return recipes.filter(is_in_shopping_cart=True)
-        return recipes
+
+    def recipe_version(self, pk):
+        """ Дата изменения рецепта и личные отметки одним запросом. """
+        user = self.request.user
+        recipes = Recipes.objects.filter(pk=pk)
+        if user.is_anonymous:
+            return recipes.values_list('updated_at').first()
+        flags = self.user_flags(user)
+        return recipes.annotate(**flags).values_list(
+            'updated_at', *flags,
+        ).first()
+
+    def overlay_user_flags(self, response):
+        if response.status_code == status.HTTP_200_OK:
+            overlay_user_flags(self.request.user, response.data)
+        return response
+
+    @action(
+        detail=False,
+        permission_classes=[IsAdminUser],
+    )
+    def cache_stats(self, request):
+        return Response(stats.as_dict())
 
     def perform_create(self, serializer):
         return serializer.save(author=self.request.user)
@@ -98,7 +255,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
     )
     def favorite(self, request, pk):
-        return self.create_obj(FavouriteSerializer, request, pk)
+        return self.create_obj(
+            favourites, FavouriteSerializer, request, pk,
+        )
 
     @action(
         detail=True,
@@ -106,68 +265,100 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
     )
     def shopping_cart(self, request, pk=None):
-        return self.create_obj(ShoppingCartSerializer, request, pk)
+        return self.create_obj(
+            shopping_cart, ShoppingCartSerializer, request, pk,
+        )
 
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, pk=None):
-        return self.del_obj(ShoppingCart, request, pk)
+        return self.del_obj(shopping_cart, request, pk)
 
     @favorite.mapping.delete
     def delete_favorite(self, request, pk):
-        return self.del_obj(Favourites, request, pk)
+        return self.del_obj(favourites, request, pk)
+
+    @action(
+        detail=False,
+        methods=['POST'],
+        url_path='favorite/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_batch(self, request):
+        return batch_response(favourites, request)
+
+    @favorite_batch.mapping.delete
+    def delete_favorite_batch(self, request):
+        return batch_response(favourites, request)
+
+    @action(
+        detail=False,
+        methods=['POST'],
+        url_path='shopping_cart/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_batch(self, request):
+        return batch_response(shopping_cart, request)
+
+    @shopping_cart_batch.mapping.delete
+    def delete_shopping_cart_batch(self, request):
+        return batch_response(shopping_cart, request)
 
     @staticmethod
-    def create_obj(serializer_class, request, recipe_id):
-        recipe = get_object_or_404(Recipes, id=recipe_id)
-        data = {
-            'user': request.user.id,
-            'recipe': recipe.id,
-        }
+    def create_obj(relations, serializer_class, request, recipe_id):
+        recipe = link_or_error(
+            relations, serializer_class, request.user, recipe_id,
+        )
         serializer = serializer_class(
-            data=data, context={'request': request}
+            relations.model(user=request.user, recipe=recipe),
+            context={'request': request},
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
-    def del_obj(model, request, recipe_id):
-        recipe = get_object_or_404(Recipes, id=recipe_id)
-        obj = get_object_or_404(
-            model,
-            user=request.user,
-            recipe=recipe,
-        )
-        obj.delete()
+    def del_obj(relations, request, recipe_id):
+        unlink_or_404(relations, request.user, recipe_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @staticmethod
-    def generate_list_for_shopping(user):
-        ingredients = (
-            RecipeIngredients.objects.filter(recipe__shoppingcarts__user=user)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(amount=Sum('amount'))
-            .order_by('ingredient__name')
-        )
-        shopping_list = []
-        for ingredient in ingredients:
-            shopping_list.append(
-                f'{ingredient["ingredient__name"]} - '
-                f'{ingredient["amount"]} '
-                f'{ingredient["ingredient__measurement_unit"]} \n'
-            )
-        return shopping_list
-
     @action(
         detail=False,
         permission_classes=[IsAuthenticated],
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        shopping_list = self.generate_list_for_shopping(user)
-        response = HttpResponse(shopping_list, 'Content-Type: text/plain')
-        response['Content-Disposition'] = 'attachment; filename="shoplist.txt"'
-        return response
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'file_format': [
+                    'Доступные форматы: '
+                    f'{", ".join(SHOPPING_LIST_FORMATS)}.'
+                ]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        render, content_type = SHOPPING_LIST_FORMATS[file_format]
+
+        def get_response():
+            response = StreamingHttpResponse(
+                render(get_shopping_list(request.user)),
+                content_type=content_type,
+            )
+            response['Content-Disposition'] = (
+                f'attachment; filename="shoplist.{file_format}"'
+            )
+            return response
+
+        cart_updated_at = CustomUser.objects.values_list(
+            'cart_updated_at', flat=True,
+        ).get(pk=request.user.pk)
+        return conditional_response(
+            request,
+            get_response,
+            make_etag(
+                request,
+                request.user.pk,
+                cart_updated_at.isoformat(),
+                file_format,
+            ),
+            cart_updated_at,
+        )
 
 
 class CustomUserViewSet(UserViewSet):
@@ -182,17 +373,16 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=[IsAuthenticated, ],
     )
     def subscribe(self, request, id=None):
-        author = get_object_or_404(User, id=id)
-        data = {
-            'user': request.user.id,
-            'author': author.id,
-        }
+        link_or_error(
+            subscriptions, SubscribeToUserSerializer, request.user, id,
+        )
         serializer = SubscribeToUserSerializer(
-            data=data,
+            Subscribe(
+                user=request.user,
+                author_id=subscriptions.prepare(id),
+            ),
             context={'request': request},
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
         return Response(
             serializer.data,
             status=status.HTTP_201_CREATED,
@@ -200,30 +390,83 @@ class CustomUserViewSet(UserViewSet):
 
     @subscribe.mapping.delete
     def delete_subscribe(self, request, id=None):
-        author = get_object_or_404(User, id=id)
-        subscribe = get_object_or_404(
-            Subscribe,
-            user=request.user,
-            author=author,
-        )
-        subscribe.delete()
+        unlink_or_404(subscriptions, request.user, id)
         return Response(
             status=status.HTTP_204_NO_CONTENT,
         )
 
+    @action(
+        detail=False,
+        methods=['POST'],
+        url_path='subscribe/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def subscribe_batch(self, request):
+        return batch_response(subscriptions, request)
+
+    @subscribe_batch.mapping.delete
+    def delete_subscribe_batch(self, request):
+        return batch_response(subscriptions, request)
+
     @action(
         detail=False, methods=['GET'],
         permission_classes=[IsAuthenticated],
-        serializer_class=UserSubscribeSerializer
+        serializer_class=UserSubscribeReadSerializer
     )
     def subscriptions(self, request):
         subscriptions = User.objects.filter(
             author__user=request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
         )
         page = self.paginate_queryset(subscriptions)
+        self.attach_author_recipes(
+            page,
+            UserSubscribeSerializer.get_recipes_limit(request),
+        )
         serializer = self.get_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
 
+    @staticmethod
+    def attach_author_recipes(authors, recipes_limit):
+        """ Последние рецепты авторов страницы одним запросом.
+
+        При заданном лимите рецепты нумеруются ROW_NUMBER() в пределах
+        автора, и в выборку попадают только первые recipes_limit строк.
+        """
+        if not authors:
+            # Пустой IN () не превращается в SQL для raw-запроса.
+            return
+        recipes = Recipes.objects.filter(
+            author_id__in=[author.id for author in authors]
+        )
+        if recipes_limit:
+            sql, params = recipes.annotate(
+                recipe_rank=Window(
+                    expression=RowNumber(),
+                    partition_by=[F('author_id')],
+                    order_by=[F('pub_date').desc(), F('id').desc()],
+                )
+            ).query.sql_with_params()
+            recipes = Recipes.objects.raw(
+                f'SELECT * FROM ({sql}) ranked_recipes '
+                'WHERE recipe_rank <= %s ORDER BY recipe_rank',
+                (*params, recipes_limit),
+            )
+        author_recipes = defaultdict(list)
+        for recipe in recipes:
+            author_recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.limited_recipes = author_recipes[author.id]
+
+    def get_serializer_class(self):
+        if (
+            self.action in ['list', 'retrieve', 'me']
+            and use_read_serializers(self.request)
+        ):
+            return UserReadSerializer
+        return super().get_serializer_class()
+
     def get_permissions(self):
         if self.action == 'me':
             return (IsAuthenticated(),)
@@ -0,0 +1,31 @@
+"""
+ASGI config for foodgram project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Запуск вместо WSGI (--workers процессов, в каждом ASGI_THREADS потоков
+для представлений):
+
+    gunicorn foodgram.asgi:application --bind 0.0.0.0:9000 \\
+        --worker-class uvicorn.workers.UvicornWorker --workers 4
+
+Каждый поток держит своё соединение с базой, поэтому workers *
+(ASGI_THREADS + число одновременных выгрузок) должно помещаться
+в max_connections PostgreSQL. Сравнить режимы под нагрузкой можно
+командой bench_deployments.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+django.setup(set_prefix=False)
+
+from api.handlers import ThreadPoolASGIHandler  # noqa: E402
+
+application = ThreadPoolASGIHandler()
@@ -1,21 +1,19 @@
-import os
-
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
-from dotenv import load_dotenv
-
-load_dotenv()
 
-DEBUG = os.getenv('DEBUG', 'True')
+from api.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    # nginx проксирует только /api/ и /admin/, поэтому метрики доступны
+    # лишь изнутри сети docker.
+    path('metrics', metrics_view),
 ]
 
-if DEBUG:
+if settings.DEBUG:
     import debug_toolbar
 
     urlpatterns += (path('__debug__/', include(debug_toolbar.urls)),)
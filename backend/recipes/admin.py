@@ -2,14 +2,21 @@ from django.contrib import admin
 from django.forms.models import BaseInlineFormSet
 from django.forms import ValidationError
 
-from .models import Favourites, Ingredients, Recipes, ShoppingCart, Tags
+from .models import (
+    Favourites,
+    Ingredients,
+    Recipes,
+    ShoppingCart,
+    ShoppingListIngredients,
+    Tags,
+)
 
 
 @admin.register(Ingredients)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'measurement_unit')
-    search_fields = ('^name')
-    list_filter = ('name')
+    search_fields = ('^name',)
+    list_filter = ('name',)
 
 
 class InlineFormset(BaseInlineFormSet):
@@ -40,24 +47,33 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('name', 'tags', 'author')
     inlines = (RecipeIngredientInline, RecipeTagsInline)
 
+    def save_related(self, request, form, formsets, change):
+        old_amounts = ShoppingListIngredients.objects.get_recipe_amounts(
+            form.instance.id
+        )
+        super().save_related(request, form, formsets, change)
+        ShoppingListIngredients.objects.update_recipe(
+            form.instance.id, old_amounts,
+        )
+
+    @admin.display(description='В избранном')
     def favourite(self, obj):
-        counter = Favourites.objects.filter(recipe=obj).count()
-        return counter
+        return obj.favourites_count
 
 
 @admin.register(Tags)
 class TagsAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'color', 'slug')
-    search_fields = ('^name')
+    search_fields = ('^name',)
 
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
-    search_fields = ('^user__username')
+    search_fields = ('^user__username',)
 
 
 @admin.register(Favourites)
 class FavouritesAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
-    search_fields = ('^user__username')
+    search_fields = ('^user__username',)
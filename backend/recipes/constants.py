@@ -2,3 +2,5 @@ NAME_LENGTH = 100
 COLOR_LENGTH = 7
 SLUG_LENGTH = 100
 MEASUREMENT_LENGTH = 12
+CARD_IMAGE_SIZE = (480, 480)
+DETAIL_IMAGE_SIZE = (1200, 1200)
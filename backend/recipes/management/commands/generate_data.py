@@ -0,0 +1,346 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from api.catalogue import bump_version
+from recipes.models import (
+    Favourites,
+    Ingredients,
+    RecipeIngredients,
+    Recipes,
+    ShoppingCart,
+    ShoppingListIngredients,
+    Tags,
+    User,
+)
+from users.models import Subscribe
+
+BATCH_SIZE = 5000
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+DISHES = (
+    'Суп', 'Салат', 'Пирог', 'Рагу', 'Омлет', 'Каша', 'Паста', 'Запеканка',
+    'Плов', 'Блины', 'Котлеты', 'Оладьи', 'Борщ', 'Жаркое', 'Сырники',
+)
+STYLES = (
+    'по-домашнему', 'с травами', 'быстрый', 'праздничный', 'по-деревенски',
+    'лёгкий', 'острый', 'бабушкин', 'с сыром', 'постный',
+)
+WORDS = (
+    'нарезать', 'обжарить', 'добавить', 'перемешать', 'посолить', 'варить',
+    'запекать', 'остудить', 'подавать', 'минут', 'до', 'готовности', 'на',
+    'среднем', 'огне', 'и', 'с', 'в', 'духовке', 'сковороде',
+)
+
+
+def zipf_weights(count, skew):
+    """ Накопленные веса закона Ципфа: у i-го элемента 1 / (i + 1) ** skew.
+
+    При skew = 0 все элементы равновероятны.
+    """
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+class Popularity:
+    """ Выбор объектов с перекосом: немногие получают большинство выборов.
+
+    Самые популярные объекты выбираются случайно, а не по порядку id.
+    """
+
+    def __init__(self, rng, ids, skew):
+        self.rng = rng
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.cum_weights = zipf_weights(len(self.ids), skew)
+
+    def choose(self, count, exclude=None):
+        """ До count разных объектов, кроме exclude. """
+        chosen = set(self.rng.choices(
+            self.ids, cum_weights=self.cum_weights, k=count,
+        ))
+        chosen.discard(exclude)
+        return sorted(chosen)
+
+
+def copy_value(value):
+    """ Значение в текстовом формате COPY. """
+    if value is None:
+        return '\\N'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+@contextmanager
+def explicit_dates():
+    """ auto_now и auto_now_add перезаписывают даты при bulk_create. """
+    pub_date = Recipes._meta.get_field('pub_date')
+    updated_at = Recipes._meta.get_field('updated_at')
+    pub_date.auto_now_add = updated_at.auto_now = False
+    try:
+        yield
+    finally:
+        pub_date.auto_now_add = updated_at.auto_now = True
+
+
+class Loader:
+    """ Вставка пачками: bulk_create или COPY на PostgreSQL. """
+
+    def __init__(self, batch_size, use_copy):
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+
+    def insert(self, model, objects):
+        """ Вставляет объекты и возвращает их количество. """
+        objects = iter(objects)
+        inserted = 0
+        while batch := list(islice(objects, self.batch_size)):
+            if self.use_copy:
+                self.copy(model, batch)
+            else:
+                model.objects.bulk_create(batch)
+            inserted += len(batch)
+        return inserted
+
+    def insert_returning_ids(self, model, objects):
+        """ Вставляет объекты и возвращает их id в порядке вставки. """
+        last_id = model.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+        self.insert(model, objects)
+        return list(
+            model.objects.filter(pk__gt=last_id)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+    @staticmethod
+    def copy(model, batch):
+        fields = [
+            field for field in model._meta.concrete_fields
+            if not field.primary_key
+        ]
+        buffer = StringIO()
+        for obj in batch:
+            buffer.write('\t'.join(
+                copy_value(field.get_db_prep_save(
+                    getattr(obj, field.attname), connection,
+                ))
+                for field in fields
+            ))
+            buffer.write('\n')
+        buffer.seek(0)
+        columns = ', '.join(
+            connection.ops.quote_name(field.column) for field in fields
+        )
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+                f'({columns}) FROM STDIN',
+                buffer,
+            )
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт синтетических пользователей, рецепты, избранное, корзины '
+        'и подписки для нагрузочного тестирования.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', default=1000, type=int)
+        parser.add_argument('--recipes', default=5000, type=int)
+        parser.add_argument(
+            '--ingredients-per-recipe', default=(3, 12), type=int, nargs=2,
+            metavar=('MIN', 'MAX'),
+        )
+        parser.add_argument(
+            '--favourites', default=20, type=int,
+            help='Среднее количество рецептов в избранном у пользователя.',
+        )
+        parser.add_argument(
+            '--carts', default=5, type=int,
+            help='Среднее количество рецептов в корзине у пользователя.',
+        )
+        parser.add_argument(
+            '--subscriptions', default=10, type=int,
+            help='Среднее количество подписок у пользователя.',
+        )
+        parser.add_argument(
+            '--skew', default=1.1, type=float,
+            help=(
+                'Показатель закона Ципфа для популярности авторов, рецептов '
+                'и ингредиентов; 0 - равномерно.'
+            ),
+        )
+        parser.add_argument(
+            '--days', default=365, type=int,
+            help='За сколько последних дней опубликованы рецепты.',
+        )
+        parser.add_argument('--seed', default=42, type=int)
+        parser.add_argument('--batch-size', default=BATCH_SIZE, type=int)
+        parser.add_argument(
+            '--method', default='auto', choices=('auto', 'bulk', 'copy'),
+            help='auto - COPY на PostgreSQL, иначе bulk_create.',
+        )
+        parser.add_argument(
+            '--password',
+            help='Пароль пользователей; по умолчанию войти нельзя.',
+        )
+
+    def handle(self, *args, **options):
+        use_copy = options['method'] == 'copy' or (
+            options['method'] == 'auto' and connection.vendor == 'postgresql'
+        )
+        if use_copy and connection.vendor != 'postgresql':
+            raise CommandError('COPY доступен только на PostgreSQL.')
+        if options['users'] < 1 or options['recipes'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и рецепт.')
+        prefix = f'gen{options["seed"]}'
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи {prefix}_* уже созданы: укажите другой --seed.'
+            )
+        self.rng = random.Random(options['seed'])
+        self.loader = Loader(options['batch_size'], use_copy)
+        self.started = time.monotonic()
+
+        call_command('load_ingredients')
+        for name, color, slug in TAGS:
+            Tags.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color},
+            )
+        user_ids = self.create_users(prefix, options)
+        recipe_ids = self.create_recipes(user_ids, options)
+        self.create_links(user_ids, recipe_ids, options)
+        self.create_shopping_lists(user_ids[0])
+
+        # Вставки пачками не отправляют сигналы: счётчики и версии
+        # закэшированных ответов обновляются явно.
+        call_command('reconcile_counters')
+        bump_version('recipes', 'users')
+        self.log('Готово.')
+
+    def log(self, message):
+        print(f'[{time.monotonic() - self.started:7.1f} с] {message}')
+
+    def create_users(self, prefix, options):
+        password = make_password(options['password'])
+        user_ids = self.loader.insert_returning_ids(User, (
+            User(
+                username=f'{prefix}_{number}',
+                email=f'{prefix}_{number}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password,
+            )
+            for number in range(options['users'])
+        ))
+        self.log(f'Пользователей: {len(user_ids)}.')
+        return user_ids
+
+    def create_recipes(self, user_ids, options):
+        authors = Popularity(self.rng, user_ids, options['skew'])
+        now = timezone.now()
+        period = options['days'] * 24 * 60 * 60
+        with explicit_dates():
+            recipe_ids = self.loader.insert_returning_ids(Recipes, (
+                Recipes(
+                    author_id=authors.choose(1)[0],
+                    name=(
+                        f'{self.rng.choice(DISHES)} '
+                        f'{self.rng.choice(STYLES)} №{number}'
+                    ),
+                    image='recipes/images/generated.jpg',
+                    text=' '.join(
+                        self.rng.choices(WORDS, k=self.rng.randint(10, 80))
+                    ).capitalize() + '.',
+                    cooking_time=self.rng.randint(5, 240),
+                    pub_date=(pub_date := now - timedelta(
+                        seconds=self.rng.randint(0, period)
+                    )),
+                    updated_at=pub_date,
+                )
+                for number in range(options['recipes'])
+            ))
+        self.log(f'Рецептов: {len(recipe_ids)}.')
+
+        ingredients = Popularity(
+            self.rng,
+            Ingredients.objects.order_by('id').values_list('id', flat=True),
+            options['skew'],
+        )
+        low, high = options['ingredients_per_recipe']
+        count = self.loader.insert(RecipeIngredients, (
+            RecipeIngredients(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in ingredients.choose(
+                self.rng.randint(low, high)
+            )
+        ))
+        self.log(f'Ингредиентов в рецептах: {count}.')
+
+        tag_ids = list(
+            Tags.objects.order_by('id').values_list('id', flat=True)
+        )
+        count = self.loader.insert(Recipes.tags.through, (
+            Recipes.tags.through(recipes_id=recipe_id, tags_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in sorted(self.rng.sample(
+                tag_ids, self.rng.randint(1, len(tag_ids)),
+            ))
+        ))
+        self.log(f'Тегов у рецептов: {count}.')
+        return recipe_ids
+
+    def create_links(self, user_ids, recipe_ids, options):
+        recipes = Popularity(self.rng, recipe_ids, options['skew'])
+        authors = Popularity(self.rng, user_ids, options['skew'])
+        for model, field, popularity, average in (
+            (Favourites, 'recipe_id', recipes, options['favourites']),
+            (ShoppingCart, 'recipe_id', recipes, options['carts']),
+            (Subscribe, 'author_id', authors, options['subscriptions']),
+        ):
+            # Подписаться на себя нельзя.
+            self_links = model is Subscribe
+            count = self.loader.insert(model, (
+                model(user_id=user_id, **{field: target_id})
+                for user_id in user_ids
+                for target_id in popularity.choose(
+                    self.rng.randint(0, 2 * average),
+                    exclude=user_id if self_links else None,
+                )
+            ))
+            self.log(f'{model._meta.verbose_name_plural}: {count}.')
+
+    def create_shopping_lists(self, first_user_id):
+        """ Агрегат списков покупок для новых пользователей. """
+        rows = RecipeIngredients.objects.filter(
+            recipe__shoppingcarts__user_id__gte=first_user_id,
+        ).values(
+            'recipe__shoppingcarts__user', 'ingredient',
+        ).annotate(total=Sum('amount')).order_by()
+        count = self.loader.insert(ShoppingListIngredients, (
+            ShoppingListIngredients(
+                user_id=row['recipe__shoppingcarts__user'],
+                ingredient_id=row['ingredient'],
+                amount=row['total'],
+            )
+            for row in rows.iterator()
+        ))
+        self.log(f'Строк в списках покупок: {count}.')
@@ -1,24 +1,124 @@
+import csv
 import json
+import time
+from itertools import islice
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from api.catalogue import bump_version
 from recipes.models import Ingredients
 
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+
+
+def read_json(file):
+    """ Разбирает JSON-массив по одному объекту, не читая файл целиком. """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = finished = False
+    for chunk in iter(lambda: file.read(READ_SIZE), ''):
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip(', \t\r\n')
+            if not started:
+                if not buffer:
+                    break
+                if buffer[0] != '[':
+                    raise CommandError('Ожидался JSON-массив ингредиентов.')
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer[:1] == ']':
+                finished = True
+            if not buffer or finished:
+                break
+            try:
+                ingredient, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break
+            yield ingredient['name'], ingredient['measurement_unit']
+            buffer = buffer[end:]
+    if not finished or buffer.strip() != ']':
+        raise CommandError('Некорректный JSON в конце файла.')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield name, measurement_unit
+
+
+READERS = {
+    '.json': read_json,
+    '.csv': read_csv,
+}
+
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из JSON- или CSV-файла.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=settings.BASE_DIR / 'data' / 'ingredients.json',
+            type=Path,
+            help='Файл ingredients.json или ingredients.csv.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            default=BATCH_SIZE,
+            type=int,
+            help='Количество ингредиентов в одном INSERT.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать новые ингредиенты, ничего не записывая.',
+        )
+
     def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(
+                f'Неподдерживаемый формат файла: {path.suffix}.'
+            )
         print('Выгружаю ингредиенты...')
-        ingredients = json.loads(
-            (settings.BASE_DIR / 'data' / 'ingredients.json').read_text()
+        started = time.monotonic()
+        # Уже загруженные ингредиенты, чтобы посчитать пропущенные;
+        # ignore_conflicts защищает от параллельной загрузки.
+        seen = set(
+            Ingredients.objects.values_list('name', 'measurement_unit')
         )
-        for ingredient in ingredients:
-            if Ingredients.objects.filter(
-                    name=ingredient['name'],
-                    measurement_unit=ingredient['measurement_unit']
-            ).exists():
-                print(f'Найден дубликат {ingredient["name"]}...')
-                continue
-            Ingredients.objects.create(**ingredient)
+        inserted = skipped = 0
+
+        def new_ingredients(file):
+            nonlocal skipped
+            for key in reader(file):
+                if key in seen:
+                    skipped += 1
+                    continue
+                seen.add(key)
+                yield Ingredients(name=key[0], measurement_unit=key[1])
 
-        print('Данные выгружены.')
+        with open(path, encoding='utf-8') as file:
+            ingredients = new_ingredients(file)
+            while batch := list(islice(ingredients, options['batch_size'])):
+                if not options['dry_run']:
+                    Ingredients.objects.bulk_create(
+                        batch, ignore_conflicts=True,
+                    )
+                inserted += len(batch)
+
+        if inserted and not options['dry_run']:
+            # bulk_create не отправляет сигналы post_save.
+            bump_version('ingredients')
+        print(
+            f'{"Будет добавлено" if options["dry_run"] else "Добавлено"}: '
+            f'{inserted}, пропущено: {skipped}, '
+            f'время: {time.monotonic() - started:.2f} с.'
+        )
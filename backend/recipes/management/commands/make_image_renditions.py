@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipes
+from recipes.renditions import make_renditions, renditions_outdated
+
+
+class Command(BaseCommand):
+    help = 'Готовит уменьшенные копии изображений для рецептов без них.'
+
+    def handle(self, *args, **options):
+        made = 0
+        for recipe in Recipes.objects.exclude(image='').iterator():
+            if renditions_outdated(recipe):
+                make_renditions(recipe.id, recipe.image.name)
+                made += 1
+        print(f'Обработано рецептов: {made}.')
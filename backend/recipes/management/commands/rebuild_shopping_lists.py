@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredients, ShoppingListIngredients
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет агрегированные списки покупок с содержимым корзин '
+        'и пересобирает их при расхождениях.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить, ничего не изменяя.',
+        )
+
+    def handle(self, *args, **options):
+        expected = {
+            (row['recipe__shoppingcarts__user'], row['ingredient']):
+                row['total']
+            for row in RecipeIngredients.objects.filter(
+                recipe__shoppingcarts__isnull=False,
+            ).values(
+                'recipe__shoppingcarts__user', 'ingredient',
+            ).annotate(total=Sum('amount')).order_by()
+        }
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            ShoppingListIngredients.objects.values_list(
+                'user_id', 'ingredient_id', 'amount',
+            )
+        }
+        mismatches = [
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key, 0) != actual.get(key, 0)
+        ]
+        print(f'Расхождений найдено: {len(mismatches)}.')
+        if not mismatches:
+            return
+        if options['check']:
+            raise CommandError('Списки покупок не совпадают с корзинами.')
+
+        with transaction.atomic():
+            ShoppingListIngredients.objects.all().delete()
+            ShoppingListIngredients.objects.bulk_create(
+                (
+                    ShoppingListIngredients(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                    for (user_id, ingredient_id), amount in expected.items()
+                ),
+                batch_size=1000,
+            )
+            # Иначе клиенты с прежним ETag получат 304 и старый список.
+            ShoppingListIngredients.objects.touch(
+                {user_id for user_id, _ in mismatches}
+            )
+        print('Списки покупок пересобраны.')
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favourites, Recipes, ShoppingCart, User
+from users.models import Subscribe
+
+# (модель, поле счётчика, модель-источник, поле связи в источнике)
+COUNTERS = (
+    (Recipes, 'favourites_count', Favourites, 'recipe'),
+    (Recipes, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipes, 'author'),
+    (User, 'followers_count', Subscribe, 'author'),
+)
+
+
+def actual_count(source, key):
+    return Coalesce(
+        Subquery(
+            source.objects.filter(**{key: OuterRef('pk')})
+            .order_by()
+            .values(key)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики избранного, покупок, рецептов и подписчиков.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить, ничего не изменяя.',
+        )
+
+    def handle(self, *args, **options):
+        drifted_total = 0
+        for model, field, source, key in COUNTERS:
+            drifted = model.objects.annotate(
+                actual=actual_count(source, key),
+            ).exclude(**{field: F('actual')})
+            drifted_count = drifted.count()
+            drifted_total += drifted_count
+            print(
+                f'{model._meta.verbose_name_plural}.{field}: '
+                f'расхождений {drifted_count}.'
+            )
+            if drifted_count and not options['check']:
+                model.objects.filter(
+                    pk__in=list(drifted.values_list('pk', flat=True))
+                ).update(**{field: actual_count(source, key)})
+        if drifted_total and options['check']:
+            raise CommandError('Счётчики не совпадают с данными.')
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.4 on 2026-10-18 02:50
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    """ Из повторов пары пользователь-рецепт остаётся самая ранняя. """
+    for name in ('Favourites', 'ShoppingCart'):
+        model = apps.get_model('recipes', name)
+        duplicates = model.objects.values('user', 'recipe').annotate(
+            first=models.Min('id'), total=models.Count('id'),
+        ).filter(total__gt=1).order_by()
+        for row in duplicates.iterator():
+            model.objects.filter(
+                user=row['user'], recipe=row['recipe'],
+            ).exclude(id=row['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='favourites',
+            name='user_recipe_unique',
+        ),
+        migrations.AlterField(
+            model_name='recipeingredients',
+            name='amount',
+            field=models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1, message='Количество ингредиента должно быть больше 0.'), django.core.validators.MaxValueValidator(9999, message='Максимум 9999 частей ингредиента.')], verbose_name='Количество в рецепте'),
+        ),
+        migrations.AddConstraint(
+            model_name='favourites',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='favouritess_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='shoppingcarts_unique'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 3.2.4 on 2026-10-18 02:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    RecipeIngredients = apps.get_model('recipes', 'RecipeIngredients')
+    ShoppingListIngredients = apps.get_model(
+        'recipes', 'ShoppingListIngredients'
+    )
+    rows = RecipeIngredients.objects.filter(
+        recipe__shoppingcarts__isnull=False,
+    ).values(
+        'recipe__shoppingcarts__user', 'ingredient',
+    ).annotate(total=models.Sum('amount')).order_by()
+    ShoppingListIngredients.objects.bulk_create(
+        (
+            ShoppingListIngredients(
+                user_id=row['recipe__shoppingcarts__user'],
+                ingredient_id=row['ingredient'],
+                amount=row['total'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0003_unique_favourites_and_carts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListIngredients',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент списка покупок',
+                'verbose_name_plural': 'Ингредиенты списков покупок',
+            },
+        ),
+        migrations.AddField(
+            model_name='shoppinglistingredients',
+            name='ingredient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.ingredients', verbose_name='Ингредиент'),
+        ),
+        migrations.AddField(
+            model_name='shoppinglistingredients',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistingredients',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='shopping_list_ingredient_unique'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
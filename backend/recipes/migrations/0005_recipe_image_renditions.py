@@ -0,0 +1,23 @@
+# Generated by Django 3.2.4 on 2026-10-18 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppinglistingredients'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='image_card',
+            field=models.ImageField(blank=True, editable=False, upload_to='', verbose_name='Изображение для карточки'),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='image_detail',
+            field=models.ImageField(blank=True, editable=False, upload_to='', verbose_name='Изображение для страницы рецепта'),
+        ),
+    ]
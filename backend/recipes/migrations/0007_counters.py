@@ -0,0 +1,53 @@
+# Generated by Django 3.2.4 on 2026-10-18 03:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipes = apps.get_model('recipes', 'Recipes')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    counters = (
+        (Recipes, 'favourites_count', apps.get_model('recipes', 'Favourites'),
+         'recipe'),
+        (Recipes, 'in_carts_count', apps.get_model('recipes', 'ShoppingCart'),
+         'recipe'),
+        (User, 'recipes_count', Recipes, 'author'),
+        (User, 'followers_count', apps.get_model('users', 'Subscribe'),
+         'author'),
+    )
+    for model, field, source, key in counters:
+        model.objects.update(**{field: Coalesce(
+            Subquery(
+                source.objects.filter(**{key: OuterRef('pk')})
+                .order_by()
+                .values(key)
+                .annotate(total=Count('pk'))
+                .values('total')
+            ),
+            0,
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_pub_date_id_idx'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='favourites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,6 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from django.contrib.auth import get_user_model
 from django.core.validators import (
     MaxValueValidator,
@@ -5,7 +8,9 @@ from django.core.validators import (
     validate_image_file_extension,
     validate_slug
 )
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
 from .constants import (
     COLOR_LENGTH,
@@ -17,6 +22,19 @@ from .validators import validate_hex
 
 User = get_user_model()
 
+# Удаляются рецепты: их строки корзин и избранного не правят списки
+# покупок и счётчики по одной, это делает pre_delete рецепта.
+deleting_recipes = ContextVar('deleting_recipes', default=False)
+
+
+@contextmanager
+def recipes_deletion():
+    token = deleting_recipes.set(True)
+    try:
+        yield
+    finally:
+        deleting_recipes.reset(token)
+
 
 class Tags(models.Model):
     name = models.CharField(
@@ -46,6 +64,19 @@ class Tags(models.Model):
         return self.name
 
 
+class RecipesQuerySet(models.QuerySet):
+    def touch(self):
+        """ Отмечает рецепты изменёнными, не вызывая save(). """
+        return self.update(updated_at=timezone.now())
+
+    def delete(self):
+        with recipes_deletion():
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class Recipes(models.Model):
     author = models.ForeignKey(
         User,
@@ -64,6 +95,16 @@ class Recipes(models.Model):
         upload_to='recipes/images/',
         validators=[validate_image_file_extension],
     )
+    image_card = models.ImageField(
+        verbose_name='Изображение для карточки',
+        blank=True,
+        editable=False,
+    )
+    image_detail = models.ImageField(
+        verbose_name='Изображение для страницы рецепта',
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
     )
@@ -100,15 +141,43 @@ class Recipes(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    # Меняется и при правке тегов, ингредиентов и автора рецепта
+    # (см. signals.py): по нему API отвечает на условные запросы.
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    favourites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipesQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}'
 
+    def delete(self, *args, **kwargs):
+        with recipes_deletion():
+            return super().delete(*args, **kwargs)
+
 
 class Ingredients(models.Model):
     name = models.CharField(
@@ -228,3 +297,173 @@ class ShoppingCart(BaseFavour):
             f'Рецепт {self.recipe.name} '
             f'из списка покупок {self.user}'
         )
+
+
+class ShoppingListManager(models.Manager):
+    @staticmethod
+    def get_recipe_amounts(recipe_id):
+        """ Количество каждого ингредиента в рецепте. """
+        return dict(
+            RecipeIngredients.objects.filter(recipe_id=recipe_id)
+            .values_list('ingredient_id', 'amount')
+        )
+
+    def add_amounts(self, user_ids, amounts):
+        """ Прибавляет amounts к спискам покупок пользователей.
+
+        amounts - словарь {id ингредиента: количество}, отрицательное
+        количество вычитается. Строки, дошедшие до нуля, удаляются.
+        """
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items()
+            if amount
+        }
+        user_ids = list(user_ids)
+        if not amounts or not user_ids:
+            return
+        # Строки нужны только для прибавки, а обнулиться могут только
+        # при вычитании: лишние запросы не выполняются.
+        added = [
+            ingredient_id
+            for ingredient_id, amount in amounts.items()
+            if amount > 0
+        ]
+        # Внутри изменения корзины лишняя точка сохранения не нужна.
+        with transaction.atomic(savepoint=False):
+            if added:
+                self.bulk_create(
+                    [
+                        self.model(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            amount=0,
+                        )
+                        for user_id in user_ids
+                        for ingredient_id in added
+                    ],
+                    ignore_conflicts=True,
+                )
+            items = self.filter(
+                user_id__in=user_ids,
+                ingredient_id__in=amounts,
+            )
+            items.update(amount=Greatest(
+                models.Case(
+                    *[
+                        models.When(
+                            ingredient_id=ingredient_id,
+                            then=models.F('amount') + amount,
+                        )
+                        for ingredient_id, amount in amounts.items()
+                    ],
+                    output_field=models.IntegerField(),
+                ),
+                0,
+            ))
+            if len(added) < len(amounts):
+                items.filter(amount=0).delete()
+            self.touch(user_ids)
+
+    @staticmethod
+    def touch(user_ids):
+        """ Отмечает списки покупок пользователей изменёнными. """
+        User.objects.filter(pk__in=user_ids).update(
+            cart_updated_at=timezone.now(),
+        )
+
+    @staticmethod
+    def get_recipes_amounts(recipe_ids):
+        """ Суммарное количество каждого ингредиента в рецептах. """
+        return dict(
+            RecipeIngredients.objects.filter(recipe_id__in=recipe_ids)
+            .values('ingredient_id')
+            .annotate(total=models.Sum('amount'))
+            .values_list('ingredient_id', 'total')
+        )
+
+    def add_recipe(self, user_id, recipe_id):
+        self.add_amounts([user_id], self.get_recipe_amounts(recipe_id))
+
+    def remove_recipe(self, user_id, recipe_id):
+        self.add_amounts(
+            [user_id],
+            {
+                ingredient_id: -amount
+                for ingredient_id, amount
+                in self.get_recipe_amounts(recipe_id).items()
+            },
+        )
+
+    def add_recipes(self, user_id, recipe_ids):
+        self.add_amounts([user_id], self.get_recipes_amounts(recipe_ids))
+
+    def remove_recipes(self, user_id, recipe_ids):
+        self.add_amounts(
+            [user_id],
+            {
+                ingredient_id: -amount
+                for ingredient_id, amount
+                in self.get_recipes_amounts(recipe_ids).items()
+            },
+        )
+
+    def delete_recipe(self, recipe_id):
+        """ Убирает удаляемый рецепт из всех списков покупок разом. """
+        self.update_recipe(recipe_id, self.get_recipe_amounts(recipe_id), {})
+
+    def update_recipe(self, recipe_id, old_amounts, new_amounts=None):
+        """ Переносит изменение ингредиентов рецепта в списки покупок. """
+        if new_amounts is None:
+            new_amounts = self.get_recipe_amounts(recipe_id)
+        self.add_amounts(
+            ShoppingCart.objects.filter(recipe_id=recipe_id)
+            .values_list('user_id', flat=True),
+            {
+                ingredient_id: (
+                    new_amounts.get(ingredient_id, 0)
+                    - old_amounts.get(ingredient_id, 0)
+                )
+                for ingredient_id in {*new_amounts, *old_amounts}
+            },
+        )
+
+
+class ShoppingListIngredients(models.Model):
+    """ Суммарное количество ингредиента в списке покупок пользователя. """
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredients,
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE,
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+        default=0,
+    )
+
+    objects = ShoppingListManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=(
+                    'user',
+                    'ingredient',
+                ),
+                name='shopping_list_ingredient_unique',
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f'{self.ingredient.name} {self.amount} '
+            f'{self.ingredient.measurement_unit} для {self.user}'
+        )
@@ -0,0 +1,137 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from .constants import CARD_IMAGE_SIZE, DETAIL_IMAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'card': CARD_IMAGE_SIZE,
+    'detail': DETAIL_IMAGE_SIZE,
+}
+RENDITIONS_DIR = 'recipes/renditions'
+
+# Копии изображения рецепта готовы и записаны в модель.
+renditions_ready = Signal()
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_RENDITION_WORKERS,
+    thread_name_prefix='renditions',
+) if settings.IMAGE_RENDITION_WORKERS else None
+
+
+def rendition_name(image_name, rendition):
+    stem = PurePosixPath(image_name).stem
+    return f'{RENDITIONS_DIR}/{stem}_{rendition}.jpg'
+
+
+def get_rendition(recipe, rendition):
+    """ Уменьшенная копия изображения рецепта или оригинал, пока её нет. """
+    file = getattr(recipe, f'image_{rendition}')
+    if recipe.image and file.name == rendition_name(
+        recipe.image.name, rendition
+    ):
+        return file
+    return recipe.image
+
+
+def renditions_outdated(recipe):
+    return bool(recipe.image) and any(
+        getattr(recipe, f'image_{rendition}').name
+        != rendition_name(recipe.image.name, rendition)
+        for rendition in RENDITIONS
+    )
+
+
+def schedule_renditions(recipe):
+    """ Ставит подготовку копий в очередь после коммита транзакции.
+
+    При IMAGE_RENDITION_WORKERS = 0 копии готовятся сразу после коммита
+    в текущем потоке.
+    """
+    if executor is None:
+        task = partial(make_renditions, recipe.id, recipe.image.name)
+    else:
+        task = partial(
+            executor.submit, run_in_worker, recipe.id, recipe.image.name,
+        )
+    transaction.on_commit(task)
+
+
+def delete_files(names):
+    """ Удаляет файлы копий, которые больше не нужны рецепту. """
+    from .models import Recipes
+
+    storage = Recipes._meta.get_field('image').storage
+    for name in names:
+        if name:
+            storage.delete(name)
+
+
+def save_image(storage, image, name):
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=85, optimize=True)
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def make_renditions(recipe_id, image_name):
+    """ Готовит уменьшенные копии изображения рецепта. """
+    from .models import Recipes
+
+    try:
+        storage = Recipes._meta.get_field('image').storage
+        with storage.open(image_name) as file, Image.open(file) as original:
+            image = ImageOps.exif_transpose(original)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            else:
+                image = image.convert('RGB')
+        names = {}
+        for rendition, size in RENDITIONS.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            names[f'image_{rendition}'] = save_image(
+                storage, resized, rendition_name(image_name, rendition),
+            )
+        with transaction.atomic():
+            # Изображение могли заменить, пока копии готовились: тогда
+            # не нужны уже новые копии, иначе - копии прежнего.
+            previous = Recipes.objects.select_for_update().filter(
+                id=recipe_id, image=image_name,
+            ).values(*names).first()
+            if previous is not None:
+                Recipes.objects.filter(id=recipe_id).update(**names)
+        if previous is None:
+            delete_files(names.values())
+            return
+        delete_files(
+            name for name in previous.values()
+            if name not in names.values()
+        )
+        # update() не отправляет post_save, а ссылки на копии
+        # попадают в ответы API.
+        renditions_ready.send(sender=Recipes, recipe_id=recipe_id)
+    except Exception:
+        logger.exception('Не удалось подготовить копии %s', image_name)
+
+
+def run_in_worker(recipe_id, image_name):
+    try:
+        make_renditions(recipe_id, image_name)
+    finally:
+        # У каждого потока своё соединение с базой.
+        connection.close()
@@ -0,0 +1,135 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from users.counters import change_counter
+from .models import (
+    Favourites,
+    Ingredients,
+    Recipes,
+    ShoppingCart,
+    ShoppingListIngredients,
+    Tags,
+    User,
+    deleting_recipes,
+)
+from .renditions import (
+    RENDITIONS,
+    delete_files,
+    renditions_outdated,
+    renditions_ready,
+    schedule_renditions,
+)
+
+# Модель-источник: (модель со счётчиком, поле связи, поле счётчика).
+COUNTERS = {
+    Favourites: (Recipes, 'recipe_id', 'favourites_count'),
+    ShoppingCart: (Recipes, 'recipe_id', 'in_carts_count'),
+    Recipes: (User, 'author_id', 'recipes_count'),
+}
+
+
+@receiver(post_save, sender=Favourites)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipes)
+def increment_counter(sender, instance, created, **kwargs):
+    if created:
+        model, key, field = COUNTERS[sender]
+        change_counter(model, getattr(instance, key), field, 1)
+
+
+@receiver(post_delete, sender=Favourites)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipes)
+def decrement_counter(sender, instance, **kwargs):
+    if sender is not Recipes and deleting_recipes.get():
+        # Строка удаляется вместе с рецептом, а с ним и его счётчики.
+        return
+    model, key, field = COUNTERS[sender]
+    change_counter(model, getattr(instance, key), field, -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListIngredients.objects.add_recipe(
+            instance.user_id, instance.recipe_id,
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    if deleting_recipes.get():
+        # Рецепт удаляется: см. remove_deleted_recipe.
+        return
+    ShoppingListIngredients.objects.remove_recipe(
+        instance.user_id, instance.recipe_id,
+    )
+
+
+@receiver(pre_delete, sender=Recipes)
+def remove_deleted_recipe(sender, instance, **kwargs):
+    # Одним проходом по всем корзинам с рецептом. pre_delete: строки
+    # корзин и ингредиенты рецепта ещё не удалены.
+    if deleting_recipes.get():
+        ShoppingListIngredients.objects.delete_recipe(instance.pk)
+
+
+@receiver(post_save, sender=Recipes)
+def make_image_renditions(sender, instance, **kwargs):
+    if renditions_outdated(instance):
+        schedule_renditions(instance)
+
+
+@receiver(post_delete, sender=Recipes)
+def delete_image_renditions(sender, instance, **kwargs):
+    names = [
+        getattr(instance, f'image_{rendition}').name
+        for rendition in RENDITIONS
+    ]
+    transaction.on_commit(lambda: delete_files(names))
+
+
+# Recipes.updated_at меняется при любой правке того, что выводится
+# вместе с рецептом. Ингредиенты рецепта правятся только вместе с ним:
+# сериализатор и админка сохраняют сам рецепт, и auto_now обновляет
+# дату один раз на запись, а не на каждую строку.
+
+@receiver(m2m_changed, sender=Recipes.tags.through)
+def touch_recipe_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            Recipes.objects.filter(pk=instance.pk).touch()
+    elif action == 'pre_clear':
+        # После очистки со стороны тега рецептов уже не найти.
+        Recipes.objects.filter(tags=instance).touch()
+    elif action.startswith('post_') and pk_set:
+        Recipes.objects.filter(pk__in=pk_set).touch()
+
+
+@receiver(post_save, sender=Tags)
+@receiver(pre_delete, sender=Tags)
+def touch_tag_recipes(sender, instance, **kwargs):
+    Recipes.objects.filter(tags=instance).touch()
+
+
+@receiver(post_save, sender=Ingredients)
+@receiver(pre_delete, sender=Ingredients)
+def touch_ingredient_recipes(sender, instance, **kwargs):
+    # Название и единица измерения выводятся и в рецептах,
+    # и в списках покупок.
+    Recipes.objects.filter(ingredients=instance).touch()
+    ShoppingListIngredients.objects.touch(
+        ShoppingListIngredients.objects.filter(ingredient=instance)
+        .values('user_id')
+    )
+
+
+@receiver(renditions_ready, sender=Recipes)
+def touch_recipe_renditions(sender, recipe_id, **kwargs):
+    Recipes.objects.filter(pk=recipe_id).touch()
@@ -0,0 +1,14 @@
+from django.db.models import F
+
+
+def change_counter(model, pk, field, delta):
+    """ Атомарно меняет счётчик объекта, не опуская его ниже нуля. """
+    change_counters(model, [pk], field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    """ То же для нескольких объектов одним UPDATE. """
+    objects = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        objects = objects.filter(**{f'{field}__gte': -delta})
+    objects.update(**{field: F(field) + delta})